@@ -0,0 +1,309 @@
+"""Load and latency benchmarks for the file manager API.
+
+Runs the FastAPI app from main.py in this process, either through an in-memory ASGI
+transport or behind a real uvicorn server on localhost, against a local mongod.
+Logins send a face frame with the request. Without --face-image, face encoding is replaced
+with a fixed stub so no dlib work is measured; with --face-image the real detector runs on
+that photo, which is how the face login latency itself is tracked.
+
+    python benchmarks/run_benchmarks.py --concurrency 16 --output bench.json
+    python benchmarks/run_benchmarks.py --scenarios login --face-image me.jpg
+    python benchmarks/run_benchmarks.py --transport uvicorn --scenarios upload,download --sizes 65536,16777216
+
+Every run writes one JSON document (throughput, p50/p95/p99 latency, peak RSS per scenario)
+that can be diffed between releases. A throwaway database is used and dropped at the end.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ["login", "upload", "download", "list_wide", "tree_deep"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="File manager API benchmarks")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="File_Manager_bench", help="dropped after the run unless --keep-database")
+    parser.add_argument("--keep-database", action="store_true")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--port", type=int, default=8765, help="port for --transport uvicorn")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (per size for upload/download)")
+    parser.add_argument("--sizes", default="65536,1048576,8388608", help="upload/download sizes in bytes")
+    parser.add_argument("--wide-files", type=int, default=20000, help="files in the folder used by list_wide")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--tree-depth", type=int, default=50, help="nesting depth used by tree_deep")
+    parser.add_argument("--face-image", help="JPEG/PNG used for logins with real face encoding instead of the stub")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_load(name: str, request_factory, total: int, concurrency: int, bytes_per_request: int = 0):
+    # request_factory(i) is awaited total times by concurrency workers, each call is timed on its own
+    latencies, errors = [], 0
+    next_index = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for index in next_index:
+            started = time.perf_counter()
+            try:
+                response = await request_factory(index)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "requests": total,
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if bytes_per_request:
+        result["throughput_mb_s"] = round(bytes_per_request * total / elapsed / (1024 * 1024), 2)
+    print(f"{name}: {result['throughput_rps']} req/s, p95 {result['latency_ms']['p95']} ms, {errors} errors", file=sys.stderr)
+    return result
+
+
+def install_face_stubs():
+    # a fixed encoding: login measures everything except dlib
+    import numpy as np
+    import utility.faces as faces
+    import utility.workers as workers
+
+    encoding = np.full(128, 0.1, dtype=np.float32)
+    faces.encode_face = lambda image_bytes: encoding
+    workers.encode_face = faces.encode_face
+    return encoding
+
+
+def load_face_image(path: str):
+    # the real photo and its encoding, so logins run the full detection path
+    from utility.faces import encode_face
+
+    with open(path, "rb") as image_file:
+        image_bytes = image_file.read()
+    encoding = encode_face(image_bytes)
+    if encoding is None:
+        sys.exit(f"no face detected in {path}")
+    return image_bytes, encoding
+
+
+async def create_user(database, username: str, password: str, encoding):
+    import bcrypt
+    from schema.user_dto import Role
+    from utility.faces import encoding_to_binary
+
+    await database["user"].insert_one({
+        "username": username,
+        "password": bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()),
+        "image_id": None,
+        "face_encoding": encoding_to_binary(encoding),
+        "role": Role.ADMIN.value,
+    })
+
+
+async def run(args):
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["MONGO_DB_NAME"] = args.database
+
+    import httpx
+    from bson import ObjectId
+    import main
+    from configuration.database import connection, database, folders_collection, files_metadata_collection
+    from utility.search import search_fields
+
+    if args.face_image:
+        face_bytes, encoding = load_face_image(args.face_image)
+    else:
+        face_bytes, encoding = b"stub-frame", install_face_stubs()
+    face_frame = base64.b64encode(face_bytes).decode("ascii")
+    await connection.drop_database(args.database)
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "transport": args.transport,
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "results": [],
+    }
+
+    server_task = None
+    async with main.app.router.lifespan_context(main.app):
+        if args.transport == "uvicorn":
+            import uvicorn
+            server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, lifespan="off", log_level="warning"))
+            server_task = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.05)
+            client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=300)
+        else:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=300)
+
+        async with client:
+            username, password = "benchmark_admin", "benchmark_password"
+            await create_user(database, username, password, encoding)
+            credentials = {"username": username, "password": password, "face_frame": face_frame}
+            login = await client.post("/login", data=credentials)
+            login.raise_for_status()
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            root = await folders_collection.find_one({"parent_folder_id": None})
+            scenarios = args.scenarios.split(",")
+
+            if "login" in scenarios:
+                report["results"].append(await run_load(
+                    "login",
+                    lambda index: client.post("/login", data=credentials),
+                    args.requests, args.concurrency
+                ))
+
+            uploaded = {}
+            for size in [int(size) for size in args.sizes.split(",")]:
+                if "upload" not in scenarios and "download" not in scenarios:
+                    break
+                folder = await client.post("/folders", json={"name": f"upload_{size}", "parent_folder_id": str(root["_id"])}, headers=headers)
+                folder_id = folder.json()["folder_id"]
+                uploaded[size] = []
+
+                async def upload(index, size=size, folder_id=folder_id):
+                    # random bytes, so deduplication never short-cuts the write
+                    response = await client.post(
+                        "/upload",
+                        files={"file": (f"file_{index:06d}.pdf", os.urandom(size), "application/pdf")},
+                        data={"input_folder_id": folder_id},
+                        headers=headers,
+                    )
+                    if response.status_code < 400:
+                        uploaded[size].append(response.json()["file_id"])
+                    return response
+
+                result = await run_load(f"upload_{size}", upload, args.requests, args.concurrency, size)
+                if "upload" in scenarios:
+                    report["results"].append(result)
+
+                if "download" in scenarios and uploaded[size]:
+                    file_ids = uploaded[size]
+                    report["results"].append(await run_load(
+                        f"download_{size}",
+                        lambda index, file_ids=file_ids: client.get(f"/files/download-by-id/{file_ids[index % len(file_ids)]}", headers=headers),
+                        args.requests, args.concurrency, size
+                    ))
+
+            if "list_wide" in scenarios:
+                folder = await client.post("/folders", json={"name": "wide_folder", "parent_folder_id": str(root["_id"])}, headers=headers)
+                folder_id = folder.json()["folder_id"]
+                wide_folder = await folders_collection.find_one({"_id": ObjectId(folder_id)})
+                # metadata rows are inserted directly, the scenario measures listing and not uploading
+                rows = [{
+                    "filename": f"wide_{index:07d}.pdf",
+                    "folder_id": wide_folder["_id"],
+                    "ancestors": wide_folder["ancestors"] + [wide_folder["_id"]],
+                    "gridfs_id": ObjectId(),
+                    "content_type": "application/pdf",
+                    "length": index,
+                    "created_at": datetime.now(),
+                    **search_fields(f"wide_{index:07d}.pdf"),
+                } for index in range(args.wide_files)]
+                for start in range(0, len(rows), 5000):
+                    await files_metadata_collection.insert_many(rows[start:start + 5000])
+
+                async def list_all_pages(index):
+                    # walks every page of the folder, the whole walk is one timed request
+                    cursor, response = None, None
+                    while True:
+                        params = {"limit": args.page_size, "sort_by": ("name", "created_at", "size")[index % 3]}
+                        if cursor:
+                            params["cursor"] = cursor
+                        response = await client.get(f"/folders/{folder_id}", params=params, headers=headers)
+                        cursor = response.json().get("next_cursor") if response.status_code < 400 else None
+                        if not cursor:
+                            return response
+
+                report["results"].append(await run_load(
+                    "list_wide_first_page",
+                    lambda index: client.get(f"/folders/{folder_id}", params={"limit": args.page_size}, headers=headers),
+                    args.requests, args.concurrency
+                ))
+                report["results"].append(await run_load(
+                    f"list_wide_all_{args.wide_files}", list_all_pages, max(args.requests // 20, 3), args.concurrency
+                ))
+
+            if "tree_deep" in scenarios:
+                parent_id = str(root["_id"])
+                for level in range(args.tree_depth):
+                    folder = await client.post("/folders", json={"name": f"level_{level:03d}", "parent_folder_id": parent_id}, headers=headers)
+                    parent_id = folder.json()["folder_id"]
+                deepest_id = parent_id
+                report["results"].append(await run_load(
+                    f"path_depth_{args.tree_depth}",
+                    lambda index: client.get(f"/folders/{deepest_id}/path", headers=headers),
+                    args.requests, args.concurrency
+                ))
+                report["results"].append(await run_load(
+                    f"tree_depth_{args.tree_depth}",
+                    lambda index: client.get(f"/folders/{root['_id']}/tree", params={"depth": min(args.tree_depth, 20)}, headers=headers),
+                    args.requests, args.concurrency
+                ))
+
+        if server_task:
+            server.should_exit = True
+            await server_task
+
+        if not args.keep_database:
+            await connection.drop_database(args.database)
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main_entry():
+    args = parse_args()
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main_entry()
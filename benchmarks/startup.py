@@ -0,0 +1,104 @@
+"""Cold-start time and memory of the file manager API.
+
+Each sample is a fresh Python process that imports main.py and then runs the FastAPI
+lifespan startup (pool warm up, indexes, root folder, backfills) against a local mongod.
+The child reports import time, startup time, peak RSS and which heavy modules got loaded.
+
+    python benchmarks/startup.py --runs 5 --output startup.json
+    python benchmarks/startup.py --env FACE_AUTH_ENABLED=false --env THUMBNAILS_ENABLED=false
+    python benchmarks/startup.py --no-lifespan   # import cost only, no mongod needed
+
+Run it on two commits (or with two sets of --env flags) and diff the JSON reports.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["face_recognition", "dlib", "cv2", "fitz", "numpy"]
+
+# runs in the child process, prints one JSON line
+CHILD = """
+import asyncio, json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+startup_ms = None
+if {lifespan}:
+    async def start():
+        async with main.app.router.lifespan_context(main.app):
+            return time.perf_counter()
+    ready = asyncio.run(start())
+    startup_ms = (ready - imported) * 1000
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": startup_ms,
+    "peak_rss_mb": rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="File manager API startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--env", action="append", default=[], help="NAME=value set in the child, repeatable")
+    parser.add_argument("--no-lifespan", action="store_true", help="measure the import only")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def run_child(args, env):
+    code = CHILD.format(lifespan=not args.no_lifespan, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples if sample[key] is not None]
+    if not values:
+        return None
+    return {"min": round(min(values), 1), "median": round(statistics.median(values), 1), "max": round(max(values), 1)}
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ)
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    samples = []
+    for run in range(args.runs):
+        samples.append(run_child(args, env))
+        print(f"run {run + 1}: import {samples[-1]['import_ms']:.0f} ms, rss {samples[-1]['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "env": args.env,
+        "lifespan": not args.no_lifespan,
+        "import_ms": summarize(samples, "import_ms"),
+        "startup_ms": summarize(samples, "startup_ms"),
+        "peak_rss_mb": summarize(samples, "peak_rss_mb"),
+        "loaded_modules": samples[-1]["loaded"],
+        "samples": samples,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,72 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+import asyncio
+from pymongo import ASCENDING
+from configuration.settings import MONGO_URI, MONGO_DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+from utility.metrics import MongoCommandListener
 
-mongo_uri = "mongodb://localhost:27017"
-connection = MongoClient(mongo_uri)
-database = connection["File_Manager"]
+mongo_uri = MONGO_URI
+# one pooled async client shared by every router
+connection = AsyncIOMotorClient(
+    mongo_uri,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[MongoCommandListener()],   # per-command latency and per-request operation counts for /metrics
+)
+database = connection[MONGO_DB_NAME]
 
 users_collection = database["user"]
 folders_collection = database["folders"]
-files_collection = database["files"]
\ No newline at end of file
+files_metadata_collection = database["files_metadata"]
+blobs_collection = database["blobs"]   # one document per distinct file content, keyed by SHA-256
+file_versions_collection = database["file_versions"]   # previous contents of files_metadata rows
+trashed_folders_collection = database["trash.folders"]   # deleted folders, restorable until they expire
+trashed_files_collection = database["trash.files_metadata"]   # deleted files, restorable until they expire
+orphaned_gridfs_collection = database["gc.gridfs"]   # GridFS files no blob owns anymore, waiting for the garbage collector
+
+fs_bucket = AsyncIOMotorGridFSBucket(database)  # async GridFS (fs.files / fs.chunks)
+gridfs_files_collection = database["fs.files"]
+gridfs_chunks_collection = database["fs.chunks"]
+
+
+async def warm_pool():
+    # concurrent pings make the driver open MONGO_MIN_POOL_SIZE connections before the first request needs them
+    await asyncio.gather(*(connection.admin.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+
+
+async def ensure_indexes():
+    # create_index is a no-op when the index already exists, so this is safe on every startup.
+    # listings sort by (sort field, _id), so _id is the last key or mongo sorts every page in memory
+    await folders_collection.create_index([("parent_folder_id", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)])
+    await folders_collection.create_index([("parent_folder_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)])
+    await folders_collection.create_index([("parent_folder_id", ASCENDING), ("usage.total_bytes", ASCENDING), ("_id", ASCENDING)])
+    await files_metadata_collection.create_index([("folder_id", ASCENDING), ("filename", ASCENDING), ("_id", ASCENDING)])
+    await files_metadata_collection.create_index([("folder_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)])
+    await files_metadata_collection.create_index([("folder_id", ASCENDING), ("length", ASCENDING), ("_id", ASCENDING)])
+    # the same listing indexes without _id, created by earlier versions, are a prefix of the ones above
+    old_listing_indexes = (
+        (folders_collection, ("parent_folder_id_1_name_1", "parent_folder_id_1_created_at_1", "parent_folder_id_1_usage.total_bytes_1")),
+        (files_metadata_collection, ("folder_id_1_filename_1", "folder_id_1_created_at_1", "folder_id_1_length_1")),
+    )
+    for collection, index_names in old_listing_indexes:
+        existing = await collection.index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await collection.drop_index(index_name)
+    await files_metadata_collection.create_index("gridfs_id")
+    await blobs_collection.create_index("ref_count")
+    await blobs_collection.create_index("gridfs_id")
+    await gridfs_files_collection.create_index("metadata.thumbnail_of", sparse=True)
+    await folders_collection.create_index("ancestors")
+    await files_metadata_collection.create_index("ancestors")
+    await users_collection.create_index("username")
+    await folders_collection.create_index([("search_name", ASCENDING), ("_id", ASCENDING)])
+    await folders_collection.create_index("search_grams")
+    await files_metadata_collection.create_index([("search_name", ASCENDING), ("_id", ASCENDING)])
+    await files_metadata_collection.create_index("search_grams")
+    await file_versions_collection.create_index([("file_id", ASCENDING), ("version", ASCENDING)], unique=True)
+    await trashed_folders_collection.create_index("trash_id")
+    await trashed_folders_collection.create_index("expires_at")
+    await trashed_folders_collection.create_index([("trash_root", ASCENDING), ("deleted_at", ASCENDING), ("_id", ASCENDING)])   # /trash pages
+    await trashed_files_collection.create_index("trash_id")
+    await trashed_files_collection.create_index("expires_at")
+    await trashed_files_collection.create_index([("trash_root", ASCENDING), ("deleted_at", ASCENDING), ("_id", ASCENDING)])
@@ -0,0 +1,68 @@
+import os
+
+# mongo
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "File_Manager")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+
+# upload streaming
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 255 * 1024))  # bytes read per chunk and GridFS chunk size
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 50 * 1024 * 1024))  # uploads bigger than this are rejected with 413
+MAX_BATCH_UPLOAD_FILES = int(os.getenv("MAX_BATCH_UPLOAD_FILES", 100))  # parts accepted by /upload/batch
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", 0))  # storage allowed per user, 0 means unlimited
+
+# face authentication
+FACE_AUTH_ENABLED = os.getenv("FACE_AUTH_ENABLED", "true").lower() == "true"  # false on file-only workers: dlib is never imported
+FACE_AUTH_PRELOAD = os.getenv("FACE_AUTH_PRELOAD", "false").lower() == "true"  # load dlib at startup instead of on the first login
+FACE_ENCODING_CACHE_SIZE = int(os.getenv("FACE_ENCODING_CACHE_SIZE", 10000))  # enrolled encodings kept in memory
+FACE_MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", 0.4))  # max distance between encodings for a match
+FACE_IMAGE_MAX_SIZE = int(os.getenv("FACE_IMAGE_MAX_SIZE", 5 * 1024 * 1024))  # largest face photo accepted from clients
+FACE_FRAME_MAX_SIZE = int(os.getenv("FACE_FRAME_MAX_SIZE", 700 * 1024))  # largest decoded face_frame, its base64 must stay under the 1 MB form field limit of the multipart parser, bigger photos go in face_image
+FACE_DETECTION_MAX_SIDE = int(os.getenv("FACE_DETECTION_MAX_SIDE", 640))  # photos are downscaled to this before detection
+FACE_DETECTION_UPSAMPLE = int(os.getenv("FACE_DETECTION_UPSAMPLE", 0))  # HOG upsampling passes, raise it for small faces
+
+# worker pool for cpu bound auth work (bcrypt, face encoding)
+AUTH_POOL_WORKERS = int(os.getenv("AUTH_POOL_WORKERS", os.cpu_count() or 2))
+AUTH_POOL_MAX_QUEUE = int(os.getenv("AUTH_POOL_MAX_QUEUE", 64))  # calls allowed to wait before returning 503
+
+# folder listing
+FOLDER_PAGE_SIZE = int(os.getenv("FOLDER_PAGE_SIZE", 100))  # default entries per page
+FOLDER_MAX_PAGE_SIZE = int(os.getenv("FOLDER_MAX_PAGE_SIZE", 1000))
+FOLDER_TREE_MAX_DEPTH = int(os.getenv("FOLDER_TREE_MAX_DEPTH", 20))  # deepest level /folders/{id}/tree may return
+FOLDER_TREE_MAX_NODES = int(os.getenv("FOLDER_TREE_MAX_NODES", 10000))  # larger trees are cut off and flagged as truncated
+
+# background jobs
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", 1000))  # finished jobs kept for the status endpoint
+BULK_DELETE_BATCH_SIZE = int(os.getenv("BULK_DELETE_BATCH_SIZE", 1000))  # documents removed per delete_many
+
+# trash, versions and garbage collection
+TRASH_RETENTION_DAYS = float(os.getenv("TRASH_RETENTION_DAYS", 30))  # deleted items can be restored for this long
+FILE_MAX_VERSIONS = int(os.getenv("FILE_MAX_VERSIONS", 10))  # previous versions kept per file, 0 keeps all of them
+GC_ENABLED = os.getenv("GC_ENABLED", "true").lower() == "true"  # runs the garbage collector in this worker
+GC_INTERVAL_SECONDS = float(os.getenv("GC_INTERVAL_SECONDS", 60))  # pause between garbage collection passes
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", 100))  # trash entries or GridFS files removed per batch
+GC_BATCH_PAUSE_SECONDS = float(os.getenv("GC_BATCH_PAUSE_SECONDS", 0.5))  # spreads chunk deletes out so live traffic is not hit
+
+# metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # serves /metrics in Prometheus text format
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 0))  # requests slower than this are logged with their stage breakdown, 0 turns it off
+
+# jwt verification
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))  # verified tokens kept until they expire
+PASSWORD_VERSION_CACHE_SECONDS = float(os.getenv("PASSWORD_VERSION_CACHE_SECONDS", 5))  # how long other workers may still accept tokens from before a password change
+
+# thumbnails
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "true").lower() == "true"  # false skips thumbnail jobs and never imports cv2
+THUMBNAIL_SIZES = [int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,512").split(",")]  # longest side in pixels
+THUMBNAIL_MAX_SOURCE_SIZE = int(os.getenv("THUMBNAIL_MAX_SOURCE_SIZE", 25 * 1024 * 1024))  # bigger originals get no thumbnail
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", 80))
+MEDIA_POOL_WORKERS = int(os.getenv("MEDIA_POOL_WORKERS", 2))
+MEDIA_POOL_MAX_QUEUE = int(os.getenv("MEDIA_POOL_MAX_QUEUE", 256))
+
+# folder cache
+FOLDER_CACHE_ENABLED = os.getenv("FOLDER_CACHE_ENABLED", "true").lower() == "true"
+FOLDER_CACHE_SIZE = int(os.getenv("FOLDER_CACHE_SIZE", 10000))  # folder documents kept in memory
+FOLDER_CHILD_NAMES_CACHE_SIZE = int(os.getenv("FOLDER_CHILD_NAMES_CACHE_SIZE", 1000))  # parents whose subfolder names are kept
+FOLDER_CACHE_CHANGE_STREAMS = os.getenv("FOLDER_CACHE_CHANGE_STREAMS", "false").lower() == "true"  # requires a replica set
+FOLDER_CACHE_TTL_SECONDS = float(os.getenv("FOLDER_CACHE_TTL_SECONDS", 5))  # entry lifetime when change streams are off
@@ -1,27 +1,65 @@
 from fastapi import FastAPI
-from configuration.database import folders_collection
+from configuration.database import connection, folders_collection, ensure_indexes, warm_pool
 from router.user_router import user_router
 from router.folder_router import router as folder_router
 from router.files_router import router as files_router
+from router.search_router import router as search_router
+from router.trash_router import router as trash_router
+from router.metrics_router import router as metrics_router
+from utility.workers import auth_pool, media_pool, preload_face_libraries
+from utility.folder_tree import backfill_ancestors
+from utility.folder_cache import watch_folder_changes
+from utility.trash import run_garbage_collector
+from utility.search import search_fields, backfill_search_fields
+from configuration.settings import FOLDER_CACHE_ENABLED, FOLDER_CACHE_CHANGE_STREAMS, METRICS_ENABLED, FACE_AUTH_ENABLED, FACE_AUTH_PRELOAD, GC_ENABLED
+from utility.metrics import MetricsMiddleware
+import asyncio
 from datetime import datetime
 from contextlib import asynccontextmanager
 
 @asynccontextmanager   #using this decorater u can define any logic that should be executed before the application starts
 async def lifespan(app: FastAPI):
-    root_folder = folders_collection.find_one({"parent_folder_id": None})  #checks if any folder is is there or not
+    await warm_pool()   #fails fast when mongo is unreachable instead of on the first request
+    await ensure_indexes()
+    root_folder = await folders_collection.find_one({"parent_folder_id": None})  #checks if any folder is is there or not
     if not root_folder:
         new_root_folder = {
             "name": "Desktop",
             "parent_folder_id": None,
+            "ancestors": [],
+            **search_fields("Desktop"),
             "created_at": datetime.now()
         }
-        folders_collection.insert_one(new_root_folder)   #creates new folder
+        await folders_collection.insert_one(new_root_folder)   #creates new folder
         print("Default root folder created successfully.")
+    await backfill_ancestors()   #folders and files saved before ancestors were tracked
+    await backfill_search_fields()
+    if FACE_AUTH_ENABLED and FACE_AUTH_PRELOAD:
+        await preload_face_libraries()
+    change_watcher = None
+    if FOLDER_CACHE_ENABLED and FOLDER_CACHE_CHANGE_STREAMS:
+        change_watcher = asyncio.create_task(watch_folder_changes())   #keeps the folder cache in sync with other workers
+    garbage_collector = None
+    if GC_ENABLED:
+        garbage_collector = asyncio.create_task(run_garbage_collector())   #purges expired trash and unused GridFS data off the request path
     yield   #to continue anything after the application stops instead of return we use 
+    if change_watcher:
+        change_watcher.cancel()
+    if garbage_collector:
+        garbage_collector.cancel()
+    auth_pool.shutdown()
+    media_pool.shutdown()
+    connection.close()
     print("Application is shutting down.")
 
 app = FastAPI(lifespan=lifespan)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)   #per route and per stage latency, mongo operations and bytes for /metrics
 
 app.include_router(user_router)
 app.include_router(folder_router)
 app.include_router(files_router)
+app.include_router(search_router)
+app.include_router(trash_router)
+if METRICS_ENABLED:
+    app.include_router(metrics_router)
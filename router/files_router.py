@@ -1,68 +1,200 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from bson import ObjectId
 from datetime import datetime
-from io import BytesIO
-from pymongo import MongoClient
-from gridfs import GridFS
-from configuration.database import mongo_uri, database
-from security.jwtConfig import jwtBearer
+from gridfs.errors import NoFile
+import zipfile
+from configuration.database import folders_collection, files_metadata_collection, file_versions_collection, blobs_collection, fs_bucket
+from configuration.settings import MAX_BATCH_UPLOAD_FILES, THUMBNAIL_SIZES, THUMBNAILS_ENABLED
+from security.jwtConfig import jwt_bearer
 from schema.user_dto import Role
+from utility.folder_tree import child_ancestors, is_busy
+from utility.storage import store_blob, release_blobs, split_saved, dedup_report
+from utility.jobs import start_job
+from utility.folder_cache import get_folder
+from utility.search import search_fields
+from utility.metrics import stage
+from utility.usage import check_quota, files_added, file_replaced, reconcile_usage
+from utility.trash import trash_file, garbage_report
+from utility.versions import add_version
+from utility.thumbnails import generate_thumbnails, pick_thumbnail
 
 router = APIRouter(tags=["Files"])
 
-client = MongoClient(mongo_uri)  # Update with your connection settings
 
-fs = GridFS(database)  # Initialize GridFS
+ALLOWED_FILE_TYPES = ["image/jpeg", "image/png", "application/pdf"]  # Allowed types
 
-@router.post("/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    input_folder_id: str = Form(...),
-    current_user: dict = Depends(jwtBearer()),
-):
-    allowed_file_types = ["image/jpeg", "image/png", "application/pdf"]  # Allowed types
-    if file.content_type not in allowed_file_types:
+
+def validate_upload(file: UploadFile):
+    if file.content_type not in ALLOWED_FILE_TYPES:
         raise HTTPException(
             status_code=400,
             detail="Invalid file type. Only JPEG, PNG, and PDF files are allowed."
         )
 
+    # Use the original file name
+    if not file.filename or len(file.filename.strip()) < 3:
+        raise HTTPException(status_code=400, detail="File name must have at least 3 characters.")
+
+
+async def get_upload_folder(input_folder_id: str):
     if not input_folder_id or not ObjectId.is_valid(input_folder_id):
         raise HTTPException(status_code=400, detail="Invalid or missing parent folder ID.")
 
-    # Use the original file name
-    file_name = file.filename
-    if not file_name or len(file_name.strip()) < 3:
-        raise HTTPException(status_code=400, detail="File name must have at least 3 characters.")
+    # read fresh, new rows copy the folder's ancestors and the folder may have been moved or deleted by another worker
+    folder = await get_folder(ObjectId(input_folder_id), fresh=True)
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+    if await is_busy(folder):
+        raise HTTPException(status_code=409, detail="The folder is being moved or deleted.")
+    return folder
 
-    # Check for duplicate file names in the same folder
-    existing_file = database.files_metadata.find_one({"filename": file_name, "folder_id": ObjectId(input_folder_id)})
-    if existing_file:
-        raise HTTPException(status_code=409, detail="A file with the same name already exists in the specified folder.")
 
-    # Save file in GridFS
-    file_content = await file.read()
+async def store_file(file: UploadFile, folder: dict, owner: str):
+    # Stream file into GridFS, identical content already stored is referenced instead of copied
+    with stage("gridfs"):
+        gridfs_id, file_size, file_hash, deduplicated = await store_blob(file, file.filename, file.content_type)
+    metadata = {
+        "filename": file.filename,
+        "folder_id": folder["_id"],
+        "owner": owner,
+        "ancestors": child_ancestors(folder),
+        "gridfs_id": gridfs_id,  # Reference to GridFS file
+        "content_type": file.content_type,
+        **search_fields(file.filename),
+        "length": file_size,
+        "sha256": file_hash,
+        "version": 1,
+        "created_at": datetime.now(),
+    }
+    if deduplicated:
+        # thumbnails already made for this content are reused
+        blob = await blobs_collection.find_one({"_id": file_hash}, {"thumbnails": 1})
+        if blob and blob.get("thumbnails"):
+            metadata["thumbnails"] = blob["thumbnails"]
+    return metadata, deduplicated
+
 
+async def discard_unsaved(rows: list):
+    # after a failed upload only rows that really are missing give their blob reference back,
+    # rows stored before the error are live files and are counted as such
+    saved, unsaved = await split_saved(files_metadata_collection, rows)
+    await release_blobs(unsaved)
+    if saved:
+        await files_added(saved)
+
+
+def enqueue_thumbnails(metadata: dict, deduplicated: bool):
+    # new content only, the job fills in "thumbnails" on every row sharing the GridFS file
+    if not deduplicated and THUMBNAILS_ENABLED:
+        start_job("thumbnails", generate_thumbnails, metadata["gridfs_id"], metadata["content_type"])
+
+
+@router.post("/upload")
+async def upload_file(
+    file: UploadFile = File(...),
+    input_folder_id: str = Form(...),
+    current_user: dict = Depends(jwt_bearer),
+):
+    validate_upload(file)
+    folder = await get_upload_folder(input_folder_id)
+
+    # a file with the same name in the same folder gets a new version instead of a second row
+    existing_file = await files_metadata_collection.find_one({"filename": file.filename, "folder_id": folder["_id"]})
+
+    await check_quota(current_user["username"], file.size or 0)
+
+    metadata = None
     try:
-        file_id = fs.put(file_content, filename=file_name, folder_id=ObjectId(input_folder_id), content_type=file.content_type)
-        metadata = {
-            "filename": file_name,
-            "folder_id": ObjectId(input_folder_id),
-            "gridfs_id": file_id,  # Reference to GridFS file
-            "content_type": file.content_type,
-            "created_at": datetime.now(),
-        }
-        database.files_metadata.insert_one(metadata)  # Store file metadata
+        metadata, deduplicated = await store_file(file, folder, current_user["username"])
+        if existing_file:
+            file_id = existing_file["_id"]
+            version = await add_version(existing_file, metadata)
+        else:
+            file_id = (await files_metadata_collection.insert_one(metadata)).inserted_id  # Store file metadata
+            version = 1
+    except HTTPException:
+        if metadata:
+            await discard_unsaved([metadata])
+        raise
     except Exception as e:
+        if metadata:
+            await discard_unsaved([metadata])
         raise HTTPException(status_code=500, detail=f"An error occurred while saving the file: {str(e)}")
 
-    return {"message": "File uploaded successfully", "file_id": str(file_id)}
+    if existing_file:
+        await file_replaced(existing_file, metadata)
+    else:
+        await files_added([metadata])
+    enqueue_thumbnails(metadata, deduplicated)
+    return {"message": "File uploaded successfully", "file_id": str(file_id), "version": version, "deduplicated": deduplicated}
 
 
+@router.post("/upload/batch")
+async def upload_files(
+    files: list[UploadFile] = File(...),
+    input_folder_id: str = Form(...),
+    current_user: dict = Depends(jwt_bearer),
+):
+    if len(files) > MAX_BATCH_UPLOAD_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UPLOAD_FILES} files can be uploaded at once.")
+
+    for file in files:
+        validate_upload(file)
+    folder = await get_upload_folder(input_folder_id)   # validated once for the whole batch
+
+    file_names = [file.filename for file in files]
+    repeated_names = sorted({name for name in file_names if file_names.count(name) > 1})
+    if repeated_names:
+        raise HTTPException(status_code=400, detail=f"The batch contains the same file name more than once: {', '.join(repeated_names)}")
+
+    # one query finds every name that already exists in the folder, those files get a new version
+    existing_files = await files_metadata_collection.find(
+        {"folder_id": folder["_id"], "filename": {"$in": file_names}}
+    ).to_list(length=None)
+    existing_by_name = {existing["filename"]: existing for existing in existing_files}
+
+    await check_quota(current_user["username"], sum(file.size or 0 for file in files))
+
+    stored = []
+    try:
+        for file in files:
+            stored.append(await store_file(file, folder, current_user["username"]))
+        new_rows = [metadata for metadata, _ in stored if metadata["filename"] not in existing_by_name]
+        inserted_ids = (await files_metadata_collection.insert_many(new_rows)).inserted_ids if new_rows else []
+    except HTTPException:
+        await discard_unsaved([metadata for metadata, _ in stored])
+        raise
+    except Exception as e:
+        await discard_unsaved([metadata for metadata, _ in stored])
+        raise HTTPException(status_code=500, detail=f"An error occurred while saving the files: {str(e)}")
+
+    if new_rows:
+        await files_added(new_rows)
+    new_ids = iter(inserted_ids)
+    results = []
+    for metadata, deduplicated in stored:
+        existing_file = existing_by_name.get(metadata["filename"])
+        if not existing_file:
+            results.append({"filename": metadata["filename"], "file_id": str(next(new_ids)), "version": 1, "deduplicated": deduplicated})
+            enqueue_thumbnails(metadata, deduplicated)
+            continue
+        try:
+            version = await add_version(existing_file, metadata)
+        except HTTPException as e:
+            # a concurrent upload replaced this file first, the other files of the batch are kept
+            await release_blobs([metadata])
+            results.append({"filename": metadata["filename"], "file_id": str(existing_file["_id"]), "error": e.detail})
+            continue
+        await file_replaced(existing_file, metadata)
+        enqueue_thumbnails(metadata, deduplicated)
+        results.append({"filename": metadata["filename"], "file_id": str(existing_file["_id"]), "version": version, "deduplicated": deduplicated})
+
+    return {"message": "Files uploaded successfully", "files": results}
+
 
 @router.delete("/delete-file/{file_id}")
-async def delete_file(file_id: str, current_user: dict = Depends(jwtBearer())):
+async def delete_file(file_id: str, current_user: dict = Depends(jwt_bearer)):
 
     if current_user.get("role") != Role.ADMIN:
         raise HTTPException(status_code=403,detail="Only admins have access to delete the files")
@@ -70,35 +202,42 @@ async def delete_file(file_id: str, current_user: dict = Depends(jwtBearer())):
     if not ObjectId.is_valid(file_id):
         raise HTTPException(status_code=400, detail="Invalid file ID.")
 
-    file_metadata = database.files_metadata.find_one({"gridfs_id": ObjectId(file_id)})
+    # file_id is the metadata id, GridFS ids are still accepted for files uploaded before deduplication
+    file_metadata = await files_metadata_collection.find_one({"_id": ObjectId(file_id)})
+    if not file_metadata:
+        file_metadata = await files_metadata_collection.find_one({"gridfs_id": ObjectId(file_id)})
     if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found.")
 
     try:
-        fs.delete(ObjectId(file_id))  # Delete file from GridFS
-        database.files_metadata.delete_one({"gridfs_id": ObjectId(file_id)})  # Delete metadata
+        # restorable until it expires, the garbage collector removes the GridFS data afterwards
+        await trash_file(file_metadata, current_user.get("username"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred while deleting the file: {str(e)}")
 
-    return {"message": "File has been deleted successfully"}
+    return {"message": "File has been moved to the trash", "trash_id": str(file_metadata["_id"])}
 
 
 @router.put("/update-file-name/{file_id}")
-async def update_file_name(file_id: str, new_file_name: str, current_user: dict = Depends(jwtBearer())):
+async def update_file_name(file_id: str, new_file_name: str, current_user: dict = Depends(jwt_bearer)):
     if not ObjectId.is_valid(file_id):
         raise HTTPException(status_code=400, detail="Invalid file ID.")
 
-    file_metadata = database.files_metadata.find_one({"_id": ObjectId(file_id)})
+    file_metadata = await files_metadata_collection.find_one({"_id": ObjectId(file_id)})
     if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found.")
 
     if file_metadata.get("filename") == new_file_name:
         raise HTTPException(status_code=400, detail="The new file name cannot be the same as the current name.")
 
+    # names are unique per folder, an upload to an existing name adds a version to that file
+    if await files_metadata_collection.find_one({"folder_id": file_metadata["folder_id"], "filename": new_file_name}, {"_id": 1}):
+        raise HTTPException(status_code=409, detail="A file with the same name already exists in the folder.")
+
     try:
-        database.files_metadata.update_one(
+        await files_metadata_collection.update_one(
             {"_id": ObjectId(file_id)},
-            {"$set": {"filename": new_file_name}}
+            {"$set": {"filename": new_file_name, **search_fields(new_file_name)}}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred while updating the file name: {str(e)}")
@@ -106,8 +245,53 @@ async def update_file_name(file_id: str, new_file_name: str, current_user: dict
     return {"message": "File name has been updated successfully"}
 
 
+def parse_range_header(range_header: str, file_size: int):
+    # supports a single "bytes=start-end" range, anything else falls back to the full file
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":  # suffix range, e.g. bytes=-500 means the last 500 bytes
+            suffix_length = int(end_text)
+            start, end = max(file_size - suffix_length, 0), file_size - 1
+            if suffix_length <= 0:
+                start = file_size
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+    except ValueError:
+        return None
+
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range is not satisfiable.",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, min(end, file_size - 1)
+
+
+def etag_matches(if_none_match: str, etag: str):
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def iter_gridfs(gridfs_file, start: int, end: int):
+    # yields the file one GridFS chunk at a time, so memory does not grow with the file size
+    gridfs_file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        with stage("gridfs"):
+            chunk = await gridfs_file.readchunk()
+        if not chunk:
+            break
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
 @router.get("/files/download-by-id/{file_id}")
-async def download_file_by_id(file_id: str, current_user: dict = Depends(jwtBearer())):
+async def download_file_by_id(file_id: str, request: Request, current_user: dict = Depends(jwt_bearer)):
     try:
         # Convert the file_id to an ObjectId
         file_object_id = ObjectId(file_id)
@@ -115,25 +299,243 @@ async def download_file_by_id(file_id: str, current_user: dict = Depends(jwtBear
         raise HTTPException(status_code=400, detail="Invalid file ID format.")
 
     # Retrieve the file metadata
-    file_metadata = database.files_metadata.find_one({"_id": file_object_id})
+    file_metadata = await files_metadata_collection.find_one({"_id": file_object_id})
+    if not file_metadata:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return await stream_file(request, file_metadata)
+
+
+@router.get("/files/{file_id}/versions")
+async def list_file_versions(file_id: str, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file ID.")
+
+    file_metadata = await files_metadata_collection.find_one({"_id": ObjectId(file_id)}, {"filename": 1, "version": 1, "length": 1, "created_at": 1, "updated_at": 1})
+    if not file_metadata:
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    versions = await file_versions_collection.find(
+        {"file_id": file_metadata["_id"]}, {"version": 1, "length": 1, "owner": 1, "created_at": 1, "replaced_at": 1}
+    ).sort("version", -1).to_list(length=None)
+    return {
+        "file_id": file_id,
+        "filename": file_metadata["filename"],
+        "current_version": {
+            "version": file_metadata.get("version", 1),
+            "length": file_metadata.get("length"),
+            "created_at": file_metadata.get("updated_at", file_metadata.get("created_at")),
+        },
+        "previous_versions": [
+            {
+                "version": version["version"],
+                "length": version.get("length"),
+                "owner": version.get("owner"),
+                "created_at": version.get("created_at"),
+                "replaced_at": version["replaced_at"],
+            }
+            for version in versions
+        ],
+    }
+
+
+@router.get("/files/{file_id}/versions/{version}/download")
+async def download_file_version(file_id: str, version: int, request: Request, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file ID.")
+
+    file_metadata = await files_metadata_collection.find_one({"_id": ObjectId(file_id)})
     if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found.")
+    if version == file_metadata.get("version", 1):
+        return await stream_file(request, file_metadata)
+
+    old_version = await file_versions_collection.find_one({"file_id": file_metadata["_id"], "version": version})
+    if not old_version:
+        raise HTTPException(status_code=404, detail="File version not found.")
+    return await stream_file(request, {**old_version, "filename": file_metadata["filename"]})
 
 
+async def stream_file(request: Request, file_metadata: dict):
+    # full or ranged response for one stored content, conditional requests are answered from the ETag
     try:
-        gridfs_file = fs.get(file_metadata["gridfs_id"])  # Retrieve file from GridFS
+        with stage("gridfs"):
+            gridfs_file = await fs_bucket.open_download_stream(file_metadata["gridfs_id"])  # Retrieve file from GridFS
     except Exception:
         raise HTTPException(status_code=500, detail="File content is missing or corrupted.")
 
+    file_size = gridfs_file.length
+    etag_value = file_metadata.get("sha256") or gridfs_file.md5 or f"{file_metadata['gridfs_id']}-{file_size}"
+    etag = f'"{etag_value}"'
+    headers = {
+        "Content-Disposition": f'attachment; filename="{file_metadata["filename"]}"',
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    status_code = 200
+    start, end = 0, file_size - 1
+    range_header = request.headers.get("range")
+    if range_header and file_size > 0:
+        byte_range = parse_range_header(range_header, file_size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+
     return StreamingResponse(
-        BytesIO(gridfs_file.read()),
+        iter_gridfs(gridfs_file, start, end),
+        status_code=status_code,
         media_type=file_metadata.get("content_type", "application/octet-stream"),
-        headers={"Content-Disposition": f'attachment; filename="{file_metadata["filename"]}"'}
+        headers=headers
     )
 
+@router.get("/files/{file_id}/thumbnail")
+async def get_thumbnail(
+    file_id: str,
+    request: Request,
+    size: int = Query(THUMBNAIL_SIZES[0], ge=1),
+    v: str | None = None,
+    current_user: dict = Depends(jwt_bearer),
+):
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file ID.")
+
+    file_metadata = await files_metadata_collection.find_one({"_id": ObjectId(file_id)}, {"thumbnails": 1, "sha256": 1})
+    if not file_metadata:
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    thumbnails = file_metadata.get("thumbnails")
+    if not thumbnails and file_metadata.get("sha256"):
+        blob = await blobs_collection.find_one({"_id": file_metadata["sha256"]}, {"thumbnails": 1})
+        thumbnails = blob.get("thumbnails") if blob else None
+    thumbnail_id = pick_thumbnail(thumbnails or {}, size)
+    if not thumbnail_id:
+        raise HTTPException(status_code=404, detail="Thumbnail is not available for this file.")
+
+    # a thumbnail id never points at different bytes, so a URL carrying it (?v=, as listed by the folder listing)
+    # can be cached for good. a new version of the file brings new thumbnail ids and so a new URL.
+    # without v, or with an outdated one, clients revalidate against the ETag instead
+    etag = f'"{thumbnail_id}"'
+    if v == str(thumbnail_id):
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    else:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        with stage("gridfs"):
+            gridfs_file = await fs_bucket.open_download_stream(thumbnail_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Thumbnail is not available for this file.")
+    headers["Content-Length"] = str(gridfs_file.length)
+    return StreamingResponse(iter_gridfs(gridfs_file, 0, gridfs_file.length - 1), media_type="image/jpeg", headers=headers)
+
+
+class ZipStreamSink:
+    # write-only target for zipfile, it has no seek() so zipfile writes data descriptors and never goes back
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+async def iter_zip(file_rows, folder_paths: dict):
+    # builds the archive while streaming, only the current GridFS chunk is ever held in memory
+    sink = ZipStreamSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async for row in file_rows:
+            try:
+                with stage("gridfs"):
+                    gridfs_file = await fs_bucket.open_download_stream(row["gridfs_id"])
+            except NoFile:
+                continue
+            entry_info = zipfile.ZipInfo(folder_paths.get(row["folder_id"], "") + row["filename"], date_time=row["created_at"].timetuple()[:6])
+            with archive.open(entry_info, mode="w", force_zip64=True) as entry:
+                while True:
+                    with stage("gridfs"):
+                        chunk = await gridfs_file.readchunk()
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()   # central directory
+
+
+@router.get("/folders/{folder_id}/download")
+async def download_folder(folder_id: str, recursive: bool = False, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID.")
+
+    folder = await get_folder(ObjectId(folder_id))
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+
+    # path of every folder inside the archive, parents always come before their children when sorted by depth
+    folder_paths = {folder["_id"]: ""}
+    if recursive:
+        subfolders = await folders_collection.find(
+            {"ancestors": folder["_id"]}, {"name": 1, "parent_folder_id": 1, "ancestors": 1}
+        ).to_list(length=None)
+        for subfolder in sorted(subfolders, key=lambda subfolder: len(subfolder["ancestors"])):
+            folder_paths[subfolder["_id"]] = folder_paths.get(subfolder["parent_folder_id"], "") + subfolder["name"] + "/"
+
+    files_query = {"ancestors": folder["_id"]} if recursive else {"folder_id": folder["_id"]}
+    file_rows = files_metadata_collection.find(files_query, {"filename": 1, "folder_id": 1, "gridfs_id": 1, "created_at": 1})
+
+    return StreamingResponse(
+        (chunk async for chunk in iter_zip(file_rows, folder_paths) if chunk),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{folder["name"]}.zip"'}
+    )
+
+
+@router.post("/admin/storage/reconcile-usage")
+async def start_usage_reconciliation(current_user: dict = Depends(jwt_bearer)):
+    if current_user.get("role") != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins have access to storage reports")
+    job = start_job("reconcile_usage", reconcile_usage)
+    return JSONResponse(status_code=202, content={"message": "Usage reconciliation has been started", "job_id": job["id"]})
+
+
+@router.get("/admin/storage/dedup")
+async def get_dedup_report(current_user: dict = Depends(jwt_bearer)):
+    if current_user.get("role") != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins have access to storage reports")
+    return await dedup_report()
+
+
+@router.get("/admin/storage/gc")
+async def get_garbage_report(current_user: dict = Depends(jwt_bearer)):
+    if current_user.get("role") != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins have access to storage reports")
+    return await garbage_report()
+
 # Why Use async in this code particularly
 # File Operations:
 
 # Uploading and downloading files involve reading and writing large chunks of data, which are inherently I/O operations.
 # async ensures that while the program waits for these operations (e.g., file reading or writing), 
-# it doesn’t block the server from handling other requests.
\ No newline at end of file
+# it doesn’t block the server from handling other requests.
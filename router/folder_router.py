@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi import HTTPException, Depends
-from configuration.database import folders_collection, files_collection
+from fastapi.responses import JSONResponse
+from configuration.database import folders_collection, files_metadata_collection
+from configuration.settings import FOLDER_PAGE_SIZE, FOLDER_MAX_PAGE_SIZE, FOLDER_TREE_MAX_DEPTH, FOLDER_TREE_MAX_NODES
 from bson import ObjectId
 from schema.folder_dto import Folder
 from datetime import datetime
-from security.jwtConfig import jwtBearer
+from security.jwtConfig import jwt_bearer
 from schema.user_dto import Role
+from utility.pagination import encode_cursor, decode_cursor, fetch_page
+from utility.jobs import start_job, get_job
+from utility.folder_tree import move_folder_tree, is_same_or_ancestor, child_ancestors, is_busy, job_overlaps
+from utility.trash import trash_folder, trash_folder_tree
+from utility.search import search_fields
+from utility.usage import usage_of
+from utility.folder_cache import get_folder, get_child_names, folder_created, folder_changed, cache_stats
 
 
 router = APIRouter(tags=["Folders"]) 
 
 @router.post('/folders')
-def create_folder(folder: Folder, current_user: dict = Depends(jwtBearer()) ):
+async def create_folder(folder: Folder, current_user: dict = Depends(jwt_bearer) ):
     if not folder.name:
         raise HTTPException(status_code=400,detail="Folder name cannot be empty.")
     
@@ -24,21 +33,25 @@ def create_folder(folder: Folder, current_user: dict = Depends(jwtBearer()) ):
     if not ObjectId.is_valid(folder.parent_folder_id):
         raise HTTPException(status_code=400,detail="Invalid parent folder ID.")
 
-    existing_folder = folders_collection.find_one({ "name": folder.name,"parent_folder_id": ObjectId(folder.parent_folder_id)})
-    
-    if existing_folder:
-        raise HTTPException(status_code=400, detail="Folder name already exists under the same parent. Use another name.")
-        
-    parent_folder = folders_collection.find_one({"_id": ObjectId(folder.parent_folder_id)})
+    parent_folder = await get_folder(ObjectId(folder.parent_folder_id), fresh=True)   #its ancestors are copied into the new folder
     if not parent_folder:
         raise HTTPException(status_code=404,detail="Parent folder not found.")
 
+    if await is_busy(parent_folder):
+        raise HTTPException(status_code=409, detail="The parent folder is being moved or deleted.")
+
+    if folder.name in await get_child_names(parent_folder["_id"]):
+        raise HTTPException(status_code=400, detail="Folder name already exists under the same parent. Use another name.")
+
     new_folder = {
         "name": folder.name,
         "parent_folder_id": ObjectId(folder.parent_folder_id),
+        "ancestors": child_ancestors(parent_folder),
+        **search_fields(folder.name),
         "created_at": datetime.now()
     }
-    result = folders_collection.insert_one(new_folder)
+    result = await folders_collection.insert_one(new_folder)
+    folder_created(new_folder)
 
     return {
         "message": "Folder has been created successfully",
@@ -47,7 +60,7 @@ def create_folder(folder: Folder, current_user: dict = Depends(jwtBearer()) ):
 
 
 @router.delete("/folders/{folder_id}")
-def delete_folder(folder_id: str, current_user: dict = Depends(jwtBearer())):
+async def delete_folder(folder_id: str, recursive: bool = False, current_user: dict = Depends(jwt_bearer)):
 
     if current_user.get("role") != Role.ADMIN:
         raise HTTPException(status_code=403, detail="Only admins have access to delete folders")
@@ -55,18 +68,157 @@ def delete_folder(folder_id: str, current_user: dict = Depends(jwtBearer())):
     if not ObjectId.is_valid(folder_id):
         raise HTTPException(status_code=400,detail="Invalid folder ID. Please check and provide a valid ID.")
 
-    deleted = folders_collection.delete_one({"_id": ObjectId(folder_id)})
-    if deleted.deleted_count == 0:
+    folder = await get_folder(ObjectId(folder_id), fresh=True)   #the overlap check below depends on current ancestors
+    if not folder:
         raise HTTPException(status_code=404, detail="Folder not found. It may have already been deleted or does not exist.")
 
-    return {"message": "The folder has been deleted successfully"}
+    if folder.get("parent_folder_id") is None:
+        raise HTTPException(status_code=400, detail="The root folder cannot be deleted.")
+
+    if await job_overlaps(folder):
+        raise HTTPException(status_code=409, detail="The folder, one of its parents or one of its subfolders is already being moved or deleted.")
+
+    if recursive:
+        # subfolders and files are moved to the trash in batches by a background job
+        job = start_job("trash_folder", trash_folder_tree, ObjectId(folder_id), current_user.get("username"))
+        return JSONResponse(
+            status_code=202,
+            content={"message": "Folder deletion has been started", "job_id": job["id"], "trash_id": folder_id}
+        )
+
+    has_subfolders = await folders_collection.find_one({"parent_folder_id": ObjectId(folder_id)}, {"_id": 1})
+    has_files = await files_metadata_collection.find_one({"folder_id": ObjectId(folder_id)}, {"_id": 1})
+    if has_subfolders or has_files:
+        raise HTTPException(status_code=409, detail="Folder is not empty. Use recursive=true to delete it with its contents.")
+
+    if not await trash_folder(ObjectId(folder_id), current_user.get("username")):
+        raise HTTPException(status_code=404, detail="Folder not found. It may have already been deleted or does not exist.")
+    return {"message": "The folder has been moved to the trash", "trash_id": folder_id}
+
+
+@router.put("/folders/{folder_id}/move")
+async def move_folder(folder_id: str, new_parent_folder_id: str, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(folder_id) or not ObjectId.is_valid(new_parent_folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID.")
+
+    # read fresh, the cycle check below depends on current ancestors
+    folder = await get_folder(ObjectId(folder_id), fresh=True)
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+
+    if folder.get("parent_folder_id") is None:
+        raise HTTPException(status_code=400, detail="The root folder cannot be moved.")
+
+    new_parent = await get_folder(ObjectId(new_parent_folder_id), fresh=True)
+    if not new_parent:
+        raise HTTPException(status_code=404, detail="Parent folder not found.")
+
+    if is_same_or_ancestor(ObjectId(folder_id), new_parent):
+        raise HTTPException(status_code=400, detail="A folder cannot be moved into itself or one of its subfolders.")
+
+    if await job_overlaps(folder) or await is_busy(new_parent):
+        raise HTTPException(status_code=409, detail="The folder or the destination folder is being moved or deleted.")
+
+    if folder["name"] in await get_child_names(new_parent["_id"]):
+        raise HTTPException(status_code=400, detail="Folder name already exists under the same parent. Use another name.")
+
+    job = start_job("move_folder", move_folder_tree, ObjectId(folder_id), ObjectId(new_parent_folder_id))
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Folder move has been started", "job_id": job["id"]}
+    )
+
+
+@router.get("/folders/{folder_id}/path")
+async def get_folder_path(folder_id: str, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID.")
+
+    # the folder and all of its ancestors come back from one round-trip
+    pipeline = [
+        {"$match": {"_id": ObjectId(folder_id)}},
+        {"$lookup": {
+            "from": folders_collection.name,
+            "localField": "ancestors",
+            "foreignField": "_id",
+            "as": "ancestor_folders",
+            "pipeline": [{"$project": {"name": 1}}],
+        }},
+        {"$project": {"name": 1, "ancestors": 1, "ancestor_folders": 1}},
+    ]
+    result = await folders_collection.aggregate(pipeline).to_list(length=1)
+    if not result:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+
+    folder = result[0]
+    names = {ancestor["_id"]: ancestor["name"] for ancestor in folder["ancestor_folders"]}
+    path = [{"id": str(ancestor_id), "name": names.get(ancestor_id, "")} for ancestor_id in folder.get("ancestors", [])]
+    path.append({"id": folder_id, "name": folder["name"]})
+    return {"folder_id": folder_id, "path": path}
+
+
+@router.get("/folders/{folder_id}/tree")
+async def get_folder_tree(
+    folder_id: str,
+    depth: int = Query(1, ge=1, le=FOLDER_TREE_MAX_DEPTH),
+    current_user: dict = Depends(jwt_bearer),
+):
+    if not ObjectId.is_valid(folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID.")
+
+    folder = await get_folder(ObjectId(folder_id))
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+
+    # every folder below this one, at most depth levels down, from the ancestors index
+    max_ancestors = len(folder.get("ancestors", [])) + depth
+    descendants = await folders_collection.find(
+        {"ancestors": folder["_id"], "$expr": {"$lte": [{"$size": "$ancestors"}, max_ancestors]}},
+        {"name": 1, "parent_folder_id": 1}
+    ).limit(FOLDER_TREE_MAX_NODES + 1).to_list(length=FOLDER_TREE_MAX_NODES + 1)
+
+    truncated = len(descendants) > FOLDER_TREE_MAX_NODES
+    nodes = {folder["_id"]: {"id": folder_id, "name": folder["name"], "subfolders": []}}
+    for descendant in descendants[:FOLDER_TREE_MAX_NODES]:
+        nodes[descendant["_id"]] = {"id": str(descendant["_id"]), "name": descendant["name"], "subfolders": []}
+    for descendant in descendants[:FOLDER_TREE_MAX_NODES]:
+        parent = nodes.get(descendant["parent_folder_id"])
+        if parent:
+            parent["subfolders"].append(nodes[descendant["_id"]])
+
+    return {"tree": nodes[folder["_id"]], "depth": depth, "truncated": truncated}
+
+
+@router.get("/folders/{folder_id}/usage")
+async def get_folder_usage(folder_id: str, current_user: dict = Depends(jwt_bearer)):
+    if not ObjectId.is_valid(folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID.")
+
+    # read directly, the cached folder document does not follow every upload
+    folder = await folders_collection.find_one({"_id": ObjectId(folder_id)}, {"name": 1, "usage": 1})
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found.")
+    return {"folder_id": folder_id, "folder_name": folder["name"], **usage_of(folder)}
+
+
+@router.get("/folder-cache/stats")
+async def folder_cache_stats(current_user: dict = Depends(jwt_bearer)):
+    return cache_stats()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: dict = Depends(jwt_bearer)):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
 @router.put("/update-folder-name/{folder_id}")
-def update_folder_name(folder_id: str, new_folder_name: str, current_user: dict = Depends(jwtBearer())):
+async def update_folder_name(folder_id: str, new_folder_name: str, current_user: dict = Depends(jwt_bearer)):
     if not ObjectId.is_valid(folder_id):
         raise HTTPException(status_code=400, detail="Invalid folder ID.")
     
-    folder_document = folders_collection.find_one({"_id": ObjectId(folder_id)})
+    folder_document = await get_folder(ObjectId(folder_id))
     if not folder_document:
         raise HTTPException(status_code=404, detail="Folder not found.")
     
@@ -75,34 +227,94 @@ def update_folder_name(folder_id: str, new_folder_name: str, current_user: dict
             status_code=400, 
             detail="The new folder name cannot be the same as the current name."
         )
+
+    if folder_document.get("parent_folder_id") and new_folder_name in await get_child_names(folder_document["parent_folder_id"]):
+        raise HTTPException(status_code=400, detail="Folder name already exists under the same parent. Use another name.")
     
-    folders_collection.update_one(
+    await folders_collection.update_one(
         {"_id": ObjectId(folder_id)},
-        {"$set": {"name": new_folder_name}}
+        {"$set": {"name": new_folder_name, **search_fields(new_folder_name)}}
     )
+    folder_changed(folder_document["_id"], folder_document.get("parent_folder_id"))
 
     return {"message": "Folder name has been updated successfully"}
 
+# sort key per collection for each sort_by option, a folder's size is everything stored below it
+FOLDER_SORT_FIELDS = {"name": "name", "created_at": "created_at", "size": "usage.total_bytes"}
+FILE_SORT_FIELDS = {"name": "filename", "created_at": "created_at", "size": "length"}
+
+
+def sort_value(document: dict, field: str):
+    # follows dotted paths like usage.total_bytes
+    for part in field.split("."):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+
 @router.get("/folders/{folder_id}")
-def list_folder_contents(folder_id: str, current_user: dict = Depends(jwtBearer())):
+async def list_folder_contents(
+    folder_id: str,
+    sort_by: str = Query("name", pattern="^(name|created_at|size)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(FOLDER_PAGE_SIZE, ge=1, le=FOLDER_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    include_thumbnails: bool = False,
+    current_user: dict = Depends(jwt_bearer),
+):
     try:
         folder_object_id = ObjectId(folder_id)  
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid folder ID format.")
 
-    folder = folders_collection.find_one({"_id": folder_object_id})
+    folder = await get_folder(folder_object_id)
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found.")
 
-    subfolders = list(folders_collection.find({"parent_folder_id": folder_object_id}))
-    files = list(files_collection.find({"folder_id": folder_object_id}))
+    # subfolders are listed first and files after them, the cursor remembers which part we are in
+    descending = order == "desc"
+    after = decode_cursor(cursor) if cursor else None
+    phase = after["phase"] if after else "folders"
+    folder_sort = FOLDER_SORT_FIELDS[sort_by]
+    file_sort = FILE_SORT_FIELDS[sort_by]
+
+    file_projection = {"filename": 1, "thumbnails": 1} if include_thumbnails else {"filename": 1}
+
+    subfolders, files = [], []
+    if phase == "folders":
+        subfolders = await fetch_page(
+            folders_collection, {"parent_folder_id": folder_object_id}, folder_sort, descending, after, limit + 1, {"name": 1}
+        )
+        after = None
+    if len(subfolders) <= limit:
+        files = await fetch_page(
+            files_metadata_collection, {"folder_id": folder_object_id}, file_sort, descending, after, limit + 1 - len(subfolders), file_projection
+        )
+
+    # one extra document is fetched to know whether there is a next page
+    next_cursor = None
+    if len(subfolders) + len(files) > limit:
+        subfolders = subfolders[:limit]
+        files = files[:limit - len(subfolders)]
+        if files:
+            last, last_phase, last_field = files[-1], "files", file_sort
+        else:
+            last, last_phase, last_field = subfolders[-1], "folders", folder_sort
+        next_cursor = encode_cursor({"phase": last_phase, "value": sort_value(last, last_field), "id": last["_id"]})
 
     subfolders_data = [{"id": str(subfolder["_id"]), "name": subfolder["name"]} for subfolder in subfolders]
     files_data = [{"id": str(file["_id"]), "name": file["filename"]} for file in files]
+    if include_thumbnails:
+        # thumbnail ids per size, and the URL to fetch each one with. the id in v= lets clients cache it for good
+        for file, file_data in zip(files, files_data):
+            file_data["thumbnails"] = {size: str(thumbnail_id) for size, thumbnail_id in file.get("thumbnails", {}).items()}
+            file_data["thumbnail_urls"] = {
+                size: f"/files/{file['_id']}/thumbnail?size={size}&v={thumbnail_id}" for size, thumbnail_id in file.get("thumbnails", {}).items()
+            }
 
     return {
         "folder_id": folder_id,
         "folder_name": folder.get("name", ""),
         "subfolders": subfolders_data,
-        "files": files_data
+        "files": files_data,
+        "next_cursor": next_cursor
     }
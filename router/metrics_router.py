@@ -0,0 +1,62 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from security.jwtConfig import token_cache
+from utility.faces import face_encoding_cache
+from utility.folder_cache import folder_cache, child_names_cache
+from utility.trash import gc_stats
+from utility.metrics import register_collector, render_metrics
+from utility.workers import auth_pool, media_pool
+
+router = APIRouter(tags=["Metrics"])
+
+
+def collect_pools():
+    pools = [auth_pool.stats(), media_pool.stats()]
+    return [
+        ("filemanager_pool_in_flight", "gauge", "Calls running or waiting in a worker pool",
+         [({"pool": pool["name"]}, pool["in_flight"]) for pool in pools]),
+        ("filemanager_pool_queue_depth", "gauge", "Calls waiting for a free worker",
+         [({"pool": pool["name"]}, pool["queue_depth"]) for pool in pools]),
+        ("filemanager_pool_completed_total", "counter", "Calls finished by a worker pool",
+         [({"pool": pool["name"]}, pool["completed"]) for pool in pools]),
+        ("filemanager_pool_rejected_total", "counter", "Calls turned away with 503 because the pool was full",
+         [({"pool": pool["name"]}, pool["rejected"]) for pool in pools]),
+    ]
+
+
+def collect_caches():
+    caches = {
+        "token": token_cache.stats(),
+        "face_encoding": face_encoding_cache.stats(),
+        "folder": folder_cache.stats(),
+        "folder_child_names": child_names_cache.stats(),
+    }
+    return [
+        ("filemanager_cache_hits_total", "counter", "Cache lookups answered from memory",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("filemanager_cache_misses_total", "counter", "Cache lookups that went to the source",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("filemanager_cache_entries", "gauge", "Entries currently cached",
+         [({"cache": name}, stats["size"]) for name, stats in caches.items()]),
+    ]
+
+
+def collect_garbage_collector():
+    return [
+        ("filemanager_gc_runs_total", "counter", "Garbage collection passes finished by this worker",
+         [({}, gc_stats["runs"])]),
+        ("filemanager_gc_purged_total", "counter", "Documents removed for good by the garbage collector",
+         [({"kind": kind}, gc_stats[f"{kind}_purged"]) for kind in ("files", "folders", "versions")]),
+        ("filemanager_gc_gridfs_files_removed_total", "counter", "GridFS files deleted because nothing referred to them",
+         [({}, gc_stats["gridfs_files_removed"])]),
+    ]
+
+
+register_collector(collect_pools)
+register_collector(collect_caches)
+register_collector(collect_garbage_collector)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from bson import ObjectId
+from datetime import datetime
+from configuration.database import folders_collection, files_metadata_collection
+from configuration.settings import FOLDER_PAGE_SIZE, FOLDER_MAX_PAGE_SIZE
+from security.jwtConfig import jwt_bearer
+from utility.pagination import encode_cursor, decode_cursor, fetch_page
+from utility.search import name_query
+
+router = APIRouter(tags=["Search"])
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    mode: str = Query("prefix", pattern="^(prefix|contains)$"),
+    kind: str = Query("all", pattern="^(all|folders|files)$"),
+    content_type: str | None = None,
+    folder_id: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    limit: int = Query(FOLDER_PAGE_SIZE, ge=1, le=FOLDER_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: dict = Depends(jwt_bearer),
+):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search text cannot be empty.")
+
+    filters = name_query(q, mode)
+    if folder_id:
+        if not ObjectId.is_valid(folder_id):
+            raise HTTPException(status_code=400, detail="Invalid folder ID.")
+        filters["ancestors"] = ObjectId(folder_id)   # anywhere below this folder
+    if created_from or created_to:
+        filters["created_at"] = {}
+        if created_from:
+            filters["created_at"]["$gte"] = created_from
+        if created_to:
+            filters["created_at"]["$lte"] = created_to
+
+    # matching folders come first and files after them, like the folder listing
+    after = decode_cursor(cursor) if cursor else None
+    phase = after["phase"] if after else ("files" if kind == "files" else "folders")
+
+    folders, files = [], []
+    if phase == "folders" and not content_type:   # folders have no content type to match
+        folders = await fetch_page(
+            folders_collection, filters, "search_name", False, after, limit + 1, {"name": 1, "parent_folder_id": 1}
+        )
+        after = None
+    if kind != "folders" and len(folders) <= limit:
+        file_filters = {**filters, "content_type": content_type} if content_type else filters
+        files = await fetch_page(
+            files_metadata_collection, file_filters, "search_name", False, after, limit + 1 - len(folders),
+            {"filename": 1, "folder_id": 1, "content_type": 1}
+        )
+
+    next_cursor = None
+    if len(folders) + len(files) > limit:
+        folders = folders[:limit]
+        files = files[:limit - len(folders)]
+        last, last_phase = (files[-1], "files") if files else (folders[-1], "folders")
+        next_cursor = encode_cursor({"phase": last_phase, "value": last.get("search_name"), "id": last["_id"]})
+
+    return {
+        "folders": [
+            {"id": str(folder["_id"]), "name": folder["name"], "parent_folder_id": str(folder["parent_folder_id"])}
+            for folder in folders
+        ],
+        "files": [
+            {"id": str(file["_id"]), "name": file["filename"], "folder_id": str(file["folder_id"]), "content_type": file.get("content_type")}
+            for file in files
+        ],
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,111 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from bson import ObjectId
+from configuration.database import files_metadata_collection, trashed_folders_collection, trashed_files_collection
+from configuration.settings import FOLDER_PAGE_SIZE, FOLDER_MAX_PAGE_SIZE
+from security.jwtConfig import jwt_bearer
+from schema.user_dto import Role
+from utility.pagination import encode_cursor, decode_cursor, fetch_page
+from utility.jobs import start_job
+from utility.folder_cache import get_folder, get_child_names
+from utility.folder_tree import is_busy
+from utility.trash import restore_file, restore_folder_tree, expire_trash
+
+router = APIRouter(tags=["Trash"])
+
+
+def require_admin(current_user: dict):
+    if current_user.get("role") != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins have access to the trash")
+
+
+@router.get("/trash")
+async def list_trash(
+    kind: str = Query("files", pattern="^(files|folders)$"),
+    limit: int = Query(FOLDER_PAGE_SIZE, ge=1, le=FOLDER_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: dict = Depends(jwt_bearer),
+):
+    require_admin(current_user)
+
+    # only what was deleted itself, not everything that went to the trash with a folder; newest first
+    collection = trashed_files_collection if kind == "files" else trashed_folders_collection
+    name_field = "filename" if kind == "files" else "name"
+    after = decode_cursor(cursor) if cursor else None
+    entries = await fetch_page(
+        collection, {"trash_root": True}, "deleted_at", True, after, limit + 1,
+        {name_field: 1, "deleted_by": 1, "expires_at": 1, "usage": 1, "length": 1}
+    )
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor({"value": entries[-1]["deleted_at"], "id": entries[-1]["_id"]})
+
+    return {
+        "kind": kind,
+        "entries": [
+            {
+                "trash_id": str(entry["_id"]),
+                "name": entry[name_field],
+                "bytes": entry.get("length") if kind == "files" else entry.get("usage", {}).get("total_bytes", 0),
+                "deleted_at": entry["deleted_at"],
+                "deleted_by": entry.get("deleted_by"),
+                "expires_at": entry["expires_at"],
+            }
+            for entry in entries
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.post("/trash/{trash_id}/restore")
+async def restore_from_trash(trash_id: str, current_user: dict = Depends(jwt_bearer)):
+    require_admin(current_user)
+    if not ObjectId.is_valid(trash_id):
+        raise HTTPException(status_code=400, detail="Invalid trash ID.")
+
+    trashed_file = await trashed_files_collection.find_one({"_id": ObjectId(trash_id), "trash_root": True})
+    if trashed_file:
+        folder = await get_folder(trashed_file["folder_id"], fresh=True)   #the restored row takes its ancestors
+        if not folder:
+            raise HTTPException(status_code=409, detail="The file's folder was deleted. Restore the folder first.")
+        if await is_busy(folder):
+            raise HTTPException(status_code=409, detail="The file's folder is being moved or deleted.")
+        if await files_metadata_collection.find_one({"folder_id": folder["_id"], "filename": trashed_file["filename"]}, {"_id": 1}):
+            raise HTTPException(status_code=409, detail="A file with the same name already exists in the folder.")
+        if not await restore_file(trashed_file, folder):
+            raise HTTPException(status_code=404, detail="Nothing with this ID is in the trash.")
+        return {"message": "File has been restored", "file_id": trash_id}
+
+    trashed_folder = await trashed_folders_collection.find_one({"_id": ObjectId(trash_id), "trash_root": True})
+    if not trashed_folder:
+        raise HTTPException(status_code=404, detail="Nothing with this ID is in the trash.")
+    parent = await get_folder(trashed_folder["parent_folder_id"], fresh=True)
+    if not parent:
+        raise HTTPException(status_code=409, detail="The parent folder was deleted. Restore it first.")
+    if await is_busy(parent):
+        raise HTTPException(status_code=409, detail="The parent folder is being moved or deleted.")
+    if trashed_folder["name"] in await get_child_names(parent["_id"]):
+        raise HTTPException(status_code=409, detail="Folder name already exists under the same parent.")
+
+    # the subtree is moved back in batches by a background job
+    job = start_job("restore_folder", restore_folder_tree, ObjectId(trash_id))
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Folder restore has been started", "job_id": job["id"], "folder_id": trash_id}
+    )
+
+
+@router.delete("/trash/{trash_id}")
+async def purge_from_trash(trash_id: str, current_user: dict = Depends(jwt_bearer)):
+    require_admin(current_user)
+    if not ObjectId.is_valid(trash_id):
+        raise HTTPException(status_code=400, detail="Invalid trash ID.")
+
+    if not await expire_trash(ObjectId(trash_id)):
+        raise HTTPException(status_code=404, detail="Nothing with this ID is in the trash.")
+    return JSONResponse(
+        status_code=202,
+        content={"message": "The entry will be removed for good by the next garbage collection", "trash_id": trash_id}
+    )
@@ -1,24 +1,86 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
 from schema.user_dto import User, Role
 from configuration.database import users_collection
-import bcrypt
 from fastapi import Form
+import base64
+import binascii
 from security.jwtToken import JwtToken
-from security.jwtConfig import jwtBearer
-from gridfs import GridFS
-import io
+from security.jwtConfig import jwt_bearer, token_cache, password_changed
 from datetime import timedelta
 from bson import ObjectId
-from configuration.database import database
-import face_recognition  
-from utility.common import capture_image
-
-fs = GridFS(database)
+from configuration.database import fs_bucket
+from configuration.settings import FACE_MATCH_TOLERANCE, FACE_IMAGE_MAX_SIZE, FACE_FRAME_MAX_SIZE, USER_QUOTA_BYTES
+from utility.faces import face_encoding_cache, encoding_to_binary, binary_to_encoding, face_distance
+from utility.usage import usage_of
+from utility.metrics import stage
+from utility.workers import auth_pool, hash_password, check_password, encode_face_async
 
 user_router = APIRouter(tags=["Users"])
 
+
+async def get_enrolled_encoding(signedup_user: dict):
+    image_id = signedup_user["image_id"]
+    stored_encoding = face_encoding_cache.get(image_id)
+    if stored_encoding is not None:
+        return stored_encoding
+
+    if signedup_user.get("face_encoding"):
+        stored_encoding = binary_to_encoding(signedup_user["face_encoding"])
+    else:
+        # users enrolled before encodings were stored: encode the signup photo once and keep the result
+        with stage("gridfs"):
+            gridfs_file = await fs_bucket.open_download_stream(ObjectId(signedup_user["image_id"]))
+            stored_image = await gridfs_file.read()
+        stored_encoding = await encode_face_async(stored_image)
+        if stored_encoding is None:
+            return None
+        await users_collection.update_one(
+            {"_id": signedup_user["_id"], "image_id": image_id},   #a re-enrollment in the meantime keeps its own encoding
+            {"$set": {"face_encoding": encoding_to_binary(stored_encoding)}}
+        )
+
+    face_encoding_cache.set(image_id, stored_encoding)
+    return stored_encoding
+
+
+async def read_face_image(face_image: UploadFile | None, face_frame: str | None):
+    # the client captures the face and sends it either as a file part or as a base64 frame
+    if face_image is not None:
+        if face_image.content_type not in ("image/jpeg", "image/png"):
+            raise HTTPException(status_code=400, detail="Face image must be a JPEG or PNG")
+        image_bytes = await face_image.read(FACE_IMAGE_MAX_SIZE + 1)
+    elif face_frame:
+        if "," in face_frame[:100]:
+            face_frame = face_frame.split(",", 1)[1]   # data:image/jpeg;base64,... urls from browsers
+        # frames are plain form fields, which the multipart parser caps at 1 MB before this code runs
+        if len(face_frame) > 4 * ((FACE_FRAME_MAX_SIZE + 2) // 3):   # base64 length of FACE_FRAME_MAX_SIZE bytes
+            raise HTTPException(
+                status_code=413,
+                detail=f"Face frame is too large. Maximum allowed size is {FACE_FRAME_MAX_SIZE} bytes, send bigger photos as face_image."
+            )
+        try:
+            image_bytes = base64.b64decode(face_frame, validate=True)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="Face frame is not valid base64")
+    else:
+        raise HTTPException(status_code=400, detail="A face image or face frame is required")
+
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Face image is empty")
+    if len(image_bytes) > FACE_IMAGE_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Face image is too large. Maximum allowed size is {FACE_IMAGE_MAX_SIZE} bytes.")
+    return image_bytes
+
+
 @user_router.post("/signup")
-def signup(user: User):
+async def signup(
+    username: str = Form(...),
+    password: str = Form(...),
+    role: Role = Form(...),
+    face_image: UploadFile | None = File(None),
+    face_frame: str | None = Form(None),
+):
+    user = User(username=username, password=password, role=role)
     if not user.username.strip():
         raise HTTPException(status_code=400, detail="Username cannot be empty or just spaces")
     if len(user.username) < 8:
@@ -28,22 +90,27 @@ def signup(user: User):
     if len(user.password) < 8:
         raise HTTPException(status_code=400, detail="Password should have at least 8 characters")
 
-    signedup_user = users_collection.find_one({"username": user.username})
+    signedup_user = await users_collection.find_one({"username": user.username})
     if signedup_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
     if user.role == Role.ADMIN:
-        no_of_admins = users_collection.count_documents({"role": Role.ADMIN.value})
+        no_of_admins = await users_collection.count_documents({"role": Role.ADMIN.value})
         if no_of_admins >= 1:
             raise HTTPException(status_code=400,detail="Only One admin is allowed") 
         
-    image_bytes = capture_image()    #captures the image and coverts it into bytes by calling the function
-    image_id = fs.put(image_bytes, content_type="image/jpeg") #the image_id is generated,the captured image bytes stored with content type "image/jpeg".
-    hashed_password = bcrypt.hashpw(user.password.encode("utf-8"), bcrypt.gensalt())
+    image_bytes = await read_face_image(face_image, face_frame)    #the face photo taken by the client
+    face_encoding = await encode_face_async(image_bytes)   #encoded once here so login only has to encode the captured frame
+    if face_encoding is None:
+        raise HTTPException(status_code=400, detail="No face detected in the captured image")
 
-    users_collection.insert_one({"username": user.username, 
+    image_id = await fs_bucket.upload_from_stream(f"{user.username}_face", image_bytes, metadata={"content_type": face_image.content_type if face_image else "image/jpeg"}) #the image_id is generated, the client photo is stored with its content type
+    hashed_password = await hash_password(user.password)
+
+    await users_collection.insert_one({"username": user.username, 
                                 "password": hashed_password,
                                 "image_id": str(image_id),
+                                "face_encoding": encoding_to_binary(face_encoding),
                                 "role": user.role.value
                                 })
 
@@ -51,32 +118,32 @@ def signup(user: User):
 
 
 @user_router.post("/login")
-def login(username: str = Form(...), password: str = Form(...)):
-    signedup_user = users_collection.find_one({"username": username})
+async def login(
+    username: str = Form(...),
+    password: str = Form(...),
+    face_image: UploadFile | None = File(None),
+    face_frame: str | None = Form(None),
+):
+    signedup_user = await users_collection.find_one({"username": username})
     if not signedup_user:
         raise HTTPException(status_code=400, detail="You have not signed up, please sign up")
-    if not bcrypt.checkpw(password.encode("utf-8"), signedup_user["password"]):
+    if not await check_password(password, signedup_user["password"]):
         raise HTTPException(status_code=400, detail="Password is incorrect")
 
-    image_bytes = capture_image()
-    stored_image = fs.get(ObjectId(signedup_user["image_id"])).read()
+    image_bytes = await read_face_image(face_image, face_frame)
 
     try:
-        captured_image = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        stored_image = face_recognition.load_image_file(io.BytesIO(stored_image))
-
-        captured_encodings = face_recognition.face_encodings(captured_image)
-        stored_encodings = face_recognition.face_encodings(stored_image)
+        stored_encoding = await get_enrolled_encoding(signedup_user)
+        captured_encoding = await encode_face_async(image_bytes)
 
-        if not captured_encodings or not stored_encodings:
+        if captured_encoding is None or stored_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected for comparison")
 
-        match = face_recognition.compare_faces([stored_encodings[0]], captured_encodings[0])
-        distance = face_recognition.face_distance([stored_encodings[0]], captured_encodings[0])
-
-        if not match[0] or distance[0] > 0.4:
+        if face_distance(stored_encoding, captured_encoding) > FACE_MATCH_TOLERANCE:
             raise HTTPException(status_code=401, detail="Face authentication failed")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during face comparison: {str(e)}")
     
@@ -84,7 +151,8 @@ def login(username: str = Form(...), password: str = Form(...)):
 
     access_token = JwtToken.create_access_token(
         {"username": username,
-         "role": user_role},   #dictionary what ever u want to store in the token
+         "role": user_role,
+         "pwd_version": signedup_user.get("password_version", 0)},   #dictionary what ever u want to store in the token, pwd_version lets a password change revoke it
         expires_delta=timedelta(minutes=15)  
     )
     return {"access_token": access_token, 
@@ -92,29 +160,75 @@ def login(username: str = Form(...), password: str = Form(...)):
             "role": user_role}
 
 
+@user_router.put("/re-enroll-face")
+async def re_enroll_face(
+    face_image: UploadFile | None = File(None),
+    face_frame: str | None = Form(None),
+    current_user: dict = Depends(jwt_bearer),
+):
+    db_user = await users_collection.find_one({"username": current_user["username"]})
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    image_bytes = await read_face_image(face_image, face_frame)
+    face_encoding = await encode_face_async(image_bytes)
+    if face_encoding is None:
+        raise HTTPException(status_code=400, detail="No face detected in the captured image")
+
+    image_id = await fs_bucket.upload_from_stream(f"{db_user['username']}_face", image_bytes, metadata={"content_type": face_image.content_type if face_image else "image/jpeg"})
+    await users_collection.update_one(
+        {"_id": db_user["_id"]},
+        {"$set": {"image_id": str(image_id), "face_encoding": encoding_to_binary(face_encoding)}}
+    )
+    face_encoding_cache.invalidate(db_user["image_id"])   #other workers miss too, their next login reads the new image_id
+
+    try:
+        await fs_bucket.delete(ObjectId(db_user["image_id"]))   #old signup photo is no longer needed
+    except Exception:
+        pass
+
+    return {"message": "Face has been re-enrolled successfully"}
+
+
 @user_router.patch("/update-password")
-def update_password(old_password: str, new_password: str, current_user: dict = Depends(jwtBearer())):
-    db_user = users_collection.find_one({"username": current_user["username"]})
+async def update_password(old_password: str, new_password: str, current_user: dict = Depends(jwt_bearer)):
+    db_user = await users_collection.find_one({"username": current_user["username"]})
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not bcrypt.checkpw(old_password.encode("utf-8"), db_user["password"]):
+    if not await check_password(old_password, db_user["password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
 
-    if bcrypt.checkpw(new_password.encode("utf-8"), db_user["password"]):
+    if new_password == old_password:   #old_password already matched the stored hash, so no second checkpw is needed
         raise HTTPException(
             status_code=400,
             detail="New password cannot be the same as the current password. Please choose a different password."
         )
 
-    hashed_password = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt())
+    hashed_password = await hash_password(new_password)
 
-    users_collection.update_one(
+    await users_collection.update_one(
         {"username": current_user["username"]}, 
-        {"$set": {"password": hashed_password}}
+        {"$set": {"password": hashed_password}, "$inc": {"password_version": 1}}
     )
+    password_changed(current_user["username"])   #tokens issued with the old password stop working, including cached ones and on other workers
     
     return {"message": "Password has been updated successfully"}
 
 
+@user_router.get("/auth-pool/stats")
+async def auth_pool_stats(current_user: dict = Depends(jwt_bearer)):
+    return auth_pool.stats()
+
+
+@user_router.get("/users/me/usage")
+async def get_my_usage(current_user: dict = Depends(jwt_bearer)):
+    db_user = await users_collection.find_one({"username": current_user["username"]}, {"usage": 1})
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"username": current_user["username"], "quota_bytes": USER_QUOTA_BYTES or None, **usage_of(db_user)}
+
 
+@user_router.get("/token-cache/stats")
+async def token_cache_stats(current_user: dict = Depends(jwt_bearer)):
+    return token_cache.stats()
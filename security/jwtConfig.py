@@ -1,11 +1,55 @@
+import hashlib
+import time
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from configuration.database import users_collection
+from configuration.settings import TOKEN_CACHE_SIZE, PASSWORD_VERSION_CACHE_SECONDS
 from security.jwtToken import JwtToken
+from utility.cache import LRUCache
+from utility.metrics import stage
 
 
 jwtToken = JwtToken()
 
+# verified claims keyed by a digest of the token, each entry expires together with its token
+token_cache = LRUCache(TOKEN_CACHE_SIZE)
+# username -> "password_version" of the user document. tokens carry the version they were issued for in "pwd_version"
+# and stop working once it is raised (e.g. by a password change). entries expire quickly so a change made through
+# another worker is seen within PASSWORD_VERSION_CACHE_SECONDS
+password_versions = LRUCache(TOKEN_CACHE_SIZE)
+
+
+async def current_password_version(username: str):
+    version = password_versions.get(username)
+    if version is None:
+        user = await users_collection.find_one({"username": username}, {"password_version": 1})
+        if not user:
+            return None
+        version = user.get("password_version", 0)
+        password_versions.set(username, version, expires_at=time.time() + PASSWORD_VERSION_CACHE_SECONDS)
+    return version
+
+
+def password_changed(username: str):
+    # this worker rejects the old tokens right away, the others once their cached version expires
+    password_versions.invalidate(username)
+
+
+async def verify_token_cached(token: str):
+    token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    payload = token_cache.get(token_key)
+    if payload is None:
+        payload = jwtToken.verify_token(token)
+        token_cache.set(token_key, payload, expires_at=payload.get("exp"))
+
+    # tokens issued before password versions existed count as version 0
+    if payload.get("pwd_version", 0) != await current_password_version(payload.get("username")):
+        token_cache.invalidate(token_key)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return dict(payload)
+
+
 class jwtBearer(HTTPBearer):
 
     def __init__(self, auto_error: bool = True):
@@ -16,6 +60,10 @@ class jwtBearer(HTTPBearer):
         if credentials:
             if not credentials.scheme == "Bearer":
                 raise HTTPException(status_code=403, detail="Invalid Token")
-            return jwtToken.verify_token(credentials.credentials)
+            with stage("jwt"):
+                return await verify_token_cached(credentials.credentials)
         else:
-            raise HTTPException(status_code=403, detail="Invalid Token")
\ No newline at end of file
+            raise HTTPException(status_code=403, detail="Invalid Token")
+
+
+jwt_bearer = jwtBearer()   # one shared dependency instance for every protected route
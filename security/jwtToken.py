@@ -1,7 +1,7 @@
 from fastapi import HTTPException
 from jose import jwt, JWTError
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 SECRET_KEY = "thisisdevelopmentkeyitcanbeanything"
 ALGORITHM = "HS384"
@@ -11,8 +11,9 @@ class JwtToken:
         
     def create_access_token(data: dict, expires_delta: timedelta | None = None):   #none is given to fallback to default time when not specified
         to_encode = data.copy()
-        expire = datetime.now() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-        to_encode.update({"exp": expire})
+        issued_at = datetime.now(timezone.utc)   #aware datetime so exp/iat are real epoch seconds whatever the server timezone
+        expire = issued_at + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+        to_encode.update({"exp": expire, "iat": issued_at})
         return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
     def verify_token(self, token: str): #validates and decodes the token
@@ -0,0 +1,176 @@
+import asyncio
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+# in-memory stand-ins for the few motor collection calls the utility modules make
+
+
+def get_path(document: dict, field: str):
+    for part in field.split("."):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+
+def set_path(document: dict, field: str, value):
+    *parents, last = field.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def field_matches(value, condition):
+    # array fields match when any element does, like in mongo
+    values = value if isinstance(value, list) else [value]
+    if isinstance(condition, dict):
+        for operator, operand in condition.items():
+            if operator == "$in" and not any(element in operand for element in values):
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$lte" and (value is None or value > operand):
+                return False
+        return True
+    return value == condition or condition in values
+
+
+def matches(document: dict, query: dict):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif field == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif not field_matches(get_path(document, field), condition):
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents: list):
+        self.documents = documents
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def skip(self, count: int):
+        self.documents = self.documents[count:]
+        return self
+
+    def limit(self, count: int):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)   # lets concurrent callers read before either of them writes
+        return self.documents if length is None else self.documents[:length]
+
+
+class FakeCollection:
+    def __init__(self, documents: list = ()):
+        self.documents = {document["_id"]: copy.deepcopy(document) for document in documents}
+
+    def find(self, query: dict = None, projection: dict = None):
+        return FakeCursor([copy.deepcopy(document) for document in self.documents.values() if matches(document, query or {})])
+
+    async def find_one(self, query: dict, projection: dict = None):
+        found = await self.find(query).to_list(length=1)
+        return found[0] if found else None
+
+    async def count_documents(self, query: dict):
+        return len([document for document in self.documents.values() if matches(document, query)])
+
+    async def distinct(self, field: str, query: dict):
+        return list({document.get(field) for document in self.documents.values() if matches(document, query)})
+
+    async def insert_one(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        self.documents[document["_id"]] = copy.deepcopy(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def update_one(self, query: dict, update: dict):
+        for document in self.documents.values():
+            if matches(document, query):
+                self.apply(document, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    async def update_many(self, query: dict, update: dict):
+        matched = [document for document in self.documents.values() if matches(document, query)]
+        for document in matched:
+            self.apply(document, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def delete_one(self, query: dict):
+        for document_id, document in list(self.documents.items()):
+            if matches(document, query):
+                del self.documents[document_id]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query: dict):
+        doomed = [document_id for document_id, document in self.documents.items() if matches(document, query)]
+        for document_id in doomed:
+            del self.documents[document_id]
+        return SimpleNamespace(deleted_count=len(doomed))
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: dict = None, return_document=None):
+        for document in self.documents.values():
+            if matches(document, query):
+                self.apply(document, update)
+                return copy.deepcopy(document)
+        return None
+
+    async def bulk_write(self, requests: list):
+        for request in requests:
+            document = next((document for document in self.documents.values() if matches(document, request._filter)), None)
+            if isinstance(request, ReplaceOne):
+                if document is not None or request._upsert:
+                    replacement = copy.deepcopy(request._doc)
+                    self.documents[replacement["_id"]] = replacement
+                continue
+            if document is None and request._upsert:
+                document = self.documents[request._filter["_id"]] = {"_id": request._filter["_id"]}
+                for field, value in request._doc.get("$setOnInsert", {}).items():
+                    document[field] = value
+            if document is not None:
+                self.apply(document, request._doc)
+
+    @staticmethod
+    def evaluate(document: dict, expression):
+        # the aggregation expressions move_folder_tree uses in its pipeline update
+        if isinstance(expression, str) and expression.startswith("$"):
+            return get_path(document, expression[1:])
+        if isinstance(expression, dict):
+            (operator, operand), = expression.items()
+            if operator == "$literal":
+                return operand
+            arguments = [FakeCollection.evaluate(document, argument) for argument in operand] if isinstance(operand, list) else FakeCollection.evaluate(document, operand)
+            if operator == "$concatArrays":
+                return [element for array in arguments for element in array]
+            if operator == "$slice":
+                array, start, count = arguments
+                return array[start:start + count]
+            if operator == "$size":
+                return len(arguments)
+        return expression
+
+    @staticmethod
+    def apply(document: dict, update):
+        if isinstance(update, list):
+            for stage in update:
+                for field, expression in stage["$set"].items():
+                    set_path(document, field, FakeCollection.evaluate(document, expression))
+            return
+        for field, value in update.get("$set", {}).items():
+            set_path(document, field, value)
+        for field in update.get("$unset", {}):
+            document.pop(field, None)
+        for field, amount in update.get("$inc", {}).items():
+            set_path(document, field, (get_path(document, field) or 0) + amount)
+        for field, value in update.get("$max", {}).items():
+            current = get_path(document, field)
+            set_path(document, field, value if current is None else max(current, value))
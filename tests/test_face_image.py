@@ -0,0 +1,43 @@
+import asyncio
+import base64
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import router.user_router as user_router
+from utility.faces import encoding_to_binary
+
+
+def test_frame_is_decoded_from_a_data_url():
+    frame = "data:image/jpeg;base64," + base64.b64encode(b"jpeg bytes").decode("ascii")
+    assert asyncio.run(user_router.read_face_image(None, frame)) == b"jpeg bytes"
+
+
+def test_frame_at_the_limit_is_accepted(monkeypatch):
+    monkeypatch.setattr(user_router, "FACE_FRAME_MAX_SIZE", 10)
+    frame = base64.b64encode(b"x" * 10).decode("ascii")
+    assert asyncio.run(user_router.read_face_image(None, frame)) == b"x" * 10
+
+
+def test_frame_over_the_limit_is_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(user_router, "FACE_FRAME_MAX_SIZE", 10)
+    frame = base64.b64encode(b"x" * 13).decode("ascii")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(user_router.read_face_image(None, frame))
+    assert error.value.status_code == 413
+    assert "face_image" in error.value.detail
+
+
+def test_frame_limit_fits_the_multipart_field_limit():
+    assert 4 * ((user_router.FACE_FRAME_MAX_SIZE + 2) // 3) + 100 <= 1024 * 1024
+
+
+def test_encoding_cached_for_an_older_photo_is_not_used():
+    # this worker cached the encoding of the first photo, another worker handled the re-enrollment
+    old_encoding, new_encoding = np.zeros(128, dtype=np.float32), np.ones(128, dtype=np.float32)
+    user_router.face_encoding_cache.set("old-image-id", old_encoding)
+    user = {"_id": "user-id", "image_id": "new-image-id", "face_encoding": encoding_to_binary(new_encoding)}
+
+    assert (asyncio.run(user_router.get_enrolled_encoding(user)) == new_encoding).all()
+    assert (user_router.face_encoding_cache.get("new-image-id") == new_encoding).all()
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import utility.folder_cache as folder_cache
+from fakes import FakeCollection
+
+
+class FakeChangeStream:
+    def __init__(self, changes: list):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for change in self.changes:
+            yield change
+
+
+@pytest.fixture
+def folders(monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(folder_cache, "folders_collection", collection)
+    folder_cache.subtree_changed()
+    return collection
+
+
+def test_fresh_read_skips_the_cached_document(folders):
+    folder_id = ObjectId()
+    folders.documents[folder_id] = {"_id": folder_id, "name": "docs", "ancestors": []}
+    asyncio.run(folder_cache.get_folder(folder_id))
+
+    new_parent = ObjectId()
+    folders.documents[folder_id]["ancestors"] = [new_parent]   # moved by another worker
+    assert asyncio.run(folder_cache.get_folder(folder_id))["ancestors"] == []
+    assert asyncio.run(folder_cache.get_folder(folder_id, fresh=True))["ancestors"] == [new_parent]
+    assert asyncio.run(folder_cache.get_folder(folder_id))["ancestors"] == [new_parent]
+
+
+def test_fresh_read_drops_a_deleted_folder(folders):
+    folder_id = ObjectId()
+    folders.documents[folder_id] = {"_id": folder_id, "name": "docs"}
+    asyncio.run(folder_cache.get_folder(folder_id))
+
+    del folders.documents[folder_id]
+    assert asyncio.run(folder_cache.get_folder(folder_id, fresh=True)) is None
+    assert asyncio.run(folder_cache.get_folder(folder_id)) is None
+
+
+def test_entries_expire_without_change_streams(folders, monkeypatch):
+    monkeypatch.setattr(folder_cache, "FOLDER_CACHE_TTL_SECONDS", -1)
+    folder_id = ObjectId()
+    folders.documents[folder_id] = {"_id": folder_id, "name": "docs"}
+    asyncio.run(folder_cache.get_folder(folder_id))
+
+    folders.documents[folder_id]["name"] = "renamed"
+    assert asyncio.run(folder_cache.get_folder(folder_id))["name"] == "renamed"
+
+
+def test_move_seen_on_the_change_stream_drops_the_old_parents_names(folders):
+    old_parent, new_parent, folder_id = ObjectId(), ObjectId(), ObjectId()
+    folder_cache.child_names_cache.set(old_parent, {"docs"})
+    folder_cache.child_names_cache.set(new_parent, set())
+    folders.watch = lambda **kwargs: FakeChangeStream([{
+        "operationType": "update",
+        "documentKey": {"_id": folder_id},
+        "fullDocument": {"_id": folder_id, "name": "docs", "parent_folder_id": new_parent},
+        "updateDescription": {"updatedFields": {"parent_folder_id": new_parent, "ancestors": [new_parent]}},
+    }])
+
+    asyncio.run(folder_cache.watch_folder_changes())
+    assert folder_cache.child_names_cache.get(old_parent) is None
+    assert folder_cache.child_names_cache.get(new_parent) is None
+
+
+def test_rename_seen_on_the_change_stream_keeps_other_parents(folders):
+    parent, other_parent, folder_id = ObjectId(), ObjectId(), ObjectId()
+    folder_cache.child_names_cache.set(parent, {"docs"})
+    folder_cache.child_names_cache.set(other_parent, {"photos"})
+    folders.watch = lambda **kwargs: FakeChangeStream([{
+        "operationType": "update",
+        "documentKey": {"_id": folder_id},
+        "fullDocument": {"_id": folder_id, "name": "papers", "parent_folder_id": parent},
+        "updateDescription": {"updatedFields": {"name": "papers"}},
+    }])
+
+    asyncio.run(folder_cache.watch_folder_changes())
+    assert folder_cache.child_names_cache.get(parent) is None
+    assert folder_cache.child_names_cache.get(other_parent) == {"photos"}
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import utility.folder_tree as folder_tree
+from fakes import FakeCollection
+
+
+@pytest.fixture
+def tree(monkeypatch):
+    root, deleted, child, other = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    folders = FakeCollection([
+        {"_id": root, "ancestors": []},
+        {"_id": deleted, "ancestors": [root], "deleting": True},
+        {"_id": child, "ancestors": [root, deleted]},
+        {"_id": other, "ancestors": [root]},
+    ])
+    monkeypatch.setattr(folder_tree, "folders_collection", folders)
+    return {document_id: document for document_id, document in folders.documents.items()}, (root, deleted, child, other)
+
+
+def test_folder_being_deleted_and_everything_below_it_is_busy(tree):
+    documents, (root, deleted, child, other) = tree
+    assert asyncio.run(folder_tree.is_busy(documents[deleted]))
+    assert asyncio.run(folder_tree.is_busy(documents[child]))
+    assert not asyncio.run(folder_tree.is_busy(documents[other]))
+    assert not asyncio.run(folder_tree.is_busy(documents[root]))
+
+
+def test_child_ancestors_and_same_or_ancestor(tree):
+    documents, (root, deleted, child, other) = tree
+    assert folder_tree.child_ancestors(documents[child]) == [root, deleted, child]
+    assert folder_tree.is_same_or_ancestor(deleted, documents[child])
+    assert not folder_tree.is_same_or_ancestor(other, documents[child])
+
+
+@pytest.fixture
+def siblings(monkeypatch):
+    # root > a > a1, root > b, with one file in a1
+    root, a, a1, b, file_id = ObjectId(), ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    folders = FakeCollection([
+        {"_id": root, "parent_folder_id": None, "ancestors": []},
+        {"_id": a, "parent_folder_id": root, "ancestors": [root]},
+        {"_id": a1, "parent_folder_id": a, "ancestors": [root, a]},
+        {"_id": b, "parent_folder_id": root, "ancestors": [root]},
+    ])
+    files = FakeCollection([{"_id": file_id, "folder_id": a1, "ancestors": [root, a, a1]}])
+    monkeypatch.setattr(folder_tree, "folders_collection", folders)
+    monkeypatch.setattr(folder_tree, "files_metadata_collection", files)
+
+    async def no_usage(*args):
+        pass
+
+    monkeypatch.setattr(folder_tree, "apply_usage", no_usage)
+    return folders, files, (root, a, a1, b, file_id)
+
+
+def test_move_rewrites_the_subtree_and_drops_its_mark(siblings):
+    folders, files, (root, a, a1, b, file_id) = siblings
+    asyncio.run(folder_tree.move_folder_tree({}, a, b))
+    assert folders.documents[a]["ancestors"] == [root, b]
+    assert folders.documents[a1]["ancestors"] == [root, b, a]
+    assert files.documents[file_id]["ancestors"] == [root, b, a, a1]
+    assert "moving" not in folders.documents[a]
+
+
+def test_move_into_its_own_subtree_is_refused_by_the_job(siblings):
+    folders, files, (root, a, a1, b, file_id) = siblings
+    with pytest.raises(ValueError):
+        asyncio.run(folder_tree.move_folder_tree({}, a, a1))
+    assert folders.documents[a]["ancestors"] == [root]
+
+
+def test_crossed_moves_never_build_a_cycle(siblings):
+    folders, files, (root, a, a1, b, file_id) = siblings
+
+    async def move_both():
+        return await asyncio.gather(
+            folder_tree.move_folder_tree({}, a, b), folder_tree.move_folder_tree({}, b, a), return_exceptions=True
+        )
+
+    results = asyncio.run(move_both())
+    assert any(isinstance(result, ValueError) for result in results)
+    assert not (b in folders.documents[a]["ancestors"] and a in folders.documents[b]["ancestors"])
+    assert all(root in folders.documents[folder_id]["ancestors"] for folder_id in (a, a1, b))
+    assert not any("moving" in folder for folder in folders.documents.values())
+
+
+def test_move_of_a_folder_moved_in_the_meantime_is_refused(siblings, monkeypatch):
+    folders, files, (root, a, a1, b, file_id) = siblings
+    stale = {"_id": a1, "ancestors": [root]}   # read before a1 was put under a
+    with pytest.raises(ValueError):
+        asyncio.run(folder_tree.move_marked_tree(stale, b))
+    assert folders.documents[a1]["ancestors"] == [root, a]
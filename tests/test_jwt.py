@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import security.jwtConfig as jwt_config
+from fakes import FakeCollection
+from security.jwtToken import JwtToken
+
+
+@pytest.fixture
+def users(monkeypatch):
+    collection = FakeCollection([{"_id": 1, "username": "someuser", "password_version": 1}])
+    monkeypatch.setattr(jwt_config, "users_collection", collection)
+    jwt_config.token_cache.clear()
+    jwt_config.password_versions.clear()
+    return collection
+
+
+def test_token_for_the_current_password_is_accepted(users):
+    token = JwtToken.create_access_token({"username": "someuser", "role": "user", "pwd_version": 1})
+    assert asyncio.run(jwt_config.verify_token_cached(token))["username"] == "someuser"
+
+
+def test_password_change_in_the_same_second_rejects_only_older_tokens(users):
+    old_token = JwtToken.create_access_token({"username": "someuser", "role": "user", "pwd_version": 1})
+    asyncio.run(jwt_config.verify_token_cached(old_token))
+
+    users.documents[1]["password_version"] = 2
+    jwt_config.password_changed("someuser")
+    new_token = JwtToken.create_access_token({"username": "someuser", "role": "user", "pwd_version": 2})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(jwt_config.verify_token_cached(old_token))
+    assert error.value.status_code == 401
+    assert asyncio.run(jwt_config.verify_token_cached(new_token))["pwd_version"] == 2
+
+
+def test_change_made_by_another_worker_is_seen_once_the_cached_version_expires(users):
+    token = JwtToken.create_access_token({"username": "someuser", "role": "user", "pwd_version": 1})
+    asyncio.run(jwt_config.verify_token_cached(token))
+
+    users.documents[1]["password_version"] = 2   # no password_changed() call in this process
+    jwt_config.password_versions.set("someuser", 1, expires_at=0)
+    with pytest.raises(HTTPException):
+        asyncio.run(jwt_config.verify_token_cached(token))
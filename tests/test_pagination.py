@@ -0,0 +1,91 @@
+from bson import ObjectId
+
+from utility.pagination import keyset_filter, encode_cursor, decode_cursor
+
+
+def matches(document: dict, query: dict):
+    # just enough of mongo's matching for keyset filters: $or, $lt, $gt, $ne and equality, where None also matches a missing field
+    if "$or" in query:
+        return any(matches(document, clause) for clause in query["$or"])
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            (operator, operand), = condition.items()
+            if operator == "$ne":
+                if value == operand:
+                    return False
+                continue
+            if value is None:
+                return False
+            if operator == "$lt" and not value < operand:
+                return False
+            if operator == "$gt" and not value > operand:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def mongo_order(documents: list, descending: bool):
+    # null and missing values sort before everything else
+    ordered = sorted(documents, key=lambda document: (document.get("length") is not None, document.get("length") or 0, document["_id"]))
+    return ordered[::-1] if descending else ordered
+
+
+def walk_pages(documents: list, descending: bool, page_size: int = 2):
+    ordered = mongo_order(documents, descending)
+    seen, after = [], None
+    while True:
+        remaining = [document for document in ordered if after is None or matches(document, keyset_filter("length", after["length"], after["_id"], descending))]
+        page = remaining[:page_size]
+        if not page:
+            return seen
+        seen += page
+        after = {"length": page[-1].get("length"), "_id": page[-1]["_id"]}
+
+
+DOCUMENTS = [
+    {"_id": ObjectId(), "length": 10},
+    {"_id": ObjectId()},
+    {"_id": ObjectId(), "length": 30},
+    {"_id": ObjectId(), "length": None},
+    {"_id": ObjectId(), "length": 10},
+    {"_id": ObjectId(), "length": 20},
+    {"_id": ObjectId()},
+]
+
+
+def test_ascending_pages_visit_every_document_once():
+    assert walk_pages(DOCUMENTS, descending=False) == mongo_order(DOCUMENTS, descending=False)
+
+
+def test_descending_pages_keep_documents_without_the_sort_field():
+    assert walk_pages(DOCUMENTS, descending=True) == mongo_order(DOCUMENTS, descending=True)
+
+
+def test_descending_filter_after_a_value_includes_nulls():
+    last_id = ObjectId()
+    assert keyset_filter("length", 10, last_id, descending=True) == {"$or": [
+        {"length": {"$lt": 10}},
+        {"length": 10, "_id": {"$lt": last_id}},
+        {"length": None},
+    ]}
+
+
+def test_ascending_filter_after_a_value_skips_nulls():
+    last_id = ObjectId()
+    assert keyset_filter("length", 10, last_id) == {"$or": [
+        {"length": {"$gt": 10}},
+        {"length": 10, "_id": {"$gt": last_id}},
+    ]}
+
+
+def test_filter_after_a_null_value():
+    last_id = ObjectId()
+    assert keyset_filter("length", None, last_id) == {"$or": [{"length": None, "_id": {"$gt": last_id}}, {"length": {"$ne": None}}]}
+    assert keyset_filter("length", None, last_id, descending=True) == {"$or": [{"length": None, "_id": {"$lt": last_id}}]}
+
+
+def test_cursor_round_trip_keeps_bson_types():
+    cursor = {"phase": "files", "value": None, "id": ObjectId()}
+    assert decode_cursor(encode_cursor(cursor)) == cursor
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import router.files_router as files_router
+from router.files_router import parse_range_header, etag_matches
+
+
+def test_start_and_end():
+    assert parse_range_header("bytes=0-99", 1000) == (0, 99)
+
+
+def test_open_ended_range_runs_to_the_last_byte():
+    assert parse_range_header("bytes=500-", 1000) == (500, 999)
+
+
+def test_end_past_the_file_is_clamped():
+    assert parse_range_header("bytes=900-5000", 1000) == (900, 999)
+
+
+def test_suffix_range():
+    assert parse_range_header("bytes=-100", 1000) == (900, 999)
+    assert parse_range_header("bytes=-5000", 1000) == (0, 999)
+
+
+@pytest.mark.parametrize("header", ["items=0-10", "bytes=0-10,20-30", "bytes=a-b", "bytes=-"])
+def test_unsupported_ranges_fall_back_to_the_full_file(header):
+    assert parse_range_header(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range_header(header, 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */1000"
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"other"', '"abc"')
+
+
+class FakeGridOut:
+    def __init__(self, content: bytes, chunk_size: int = 4):
+        self.content = content
+        self.length = len(content)
+        self.md5 = None
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    def seek(self, position: int):
+        self.position = position
+
+    async def readchunk(self):
+        # like GridOut, never reads past the end of the chunk the position is in
+        end = min((self.position // self.chunk_size + 1) * self.chunk_size, self.length)
+        chunk = self.content[self.position:end]
+        self.position = end
+        return chunk
+
+
+@pytest.fixture
+def stored_file(monkeypatch):
+    content = b"0123456789abcdef"
+
+    async def open_download_stream(gridfs_id):
+        return FakeGridOut(content)
+
+    monkeypatch.setattr(files_router.fs_bucket, "open_download_stream", open_download_stream)
+    return {"_id": "file", "gridfs_id": "gridfs", "filename": "a.pdf", "content_type": "application/pdf", "sha256": "abc"}
+
+
+def download(file_metadata: dict, headers: dict = None):
+    request = Request({"type": "http", "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]})
+
+    async def collect():
+        response = await files_router.stream_file(request, file_metadata)
+        body = b""
+        if hasattr(response, "body_iterator"):
+            async for chunk in response.body_iterator:
+                body += chunk
+        return response, body
+
+    return asyncio.run(collect())
+
+
+def test_full_download_streams_every_chunk(stored_file):
+    response, body = download(stored_file)
+    assert response.status_code == 200
+    assert body == b"0123456789abcdef"
+    assert response.headers["etag"] == '"abc"'
+    assert response.headers["content-length"] == "16"
+
+
+def test_range_download_starts_mid_chunk(stored_file):
+    response, body = download(stored_file, {"Range": "bytes=5-10"})
+    assert response.status_code == 206
+    assert body == b"56789a"
+    assert response.headers["content-range"] == "bytes 5-10/16"
+    assert response.headers["content-length"] == "6"
+
+
+def test_matching_etag_answers_304_without_a_body(stored_file):
+    response, body = download(stored_file, {"If-None-Match": '"abc"'})
+    assert response.status_code == 304
+    assert body == b""
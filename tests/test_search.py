@@ -0,0 +1,21 @@
+from utility.search import name_query, search_fields
+
+
+def test_prefix_query_is_anchored():
+    assert name_query("Rep", "prefix") == {"search_name": {"$regex": "^rep"}}
+
+
+def test_contains_query_narrows_by_grams():
+    assert name_query("port", "contains") == {"search_grams": {"$all": ["ort", "por"]}, "search_name": {"$regex": "port"}}
+
+
+def test_short_contains_query_is_not_anchored():
+    assert name_query("PD", "contains") == {"search_name": {"$regex": "pd"}}
+
+
+def test_query_text_is_escaped():
+    assert name_query("a.b", "contains")["search_name"] == {"$regex": r"a\.b"}
+
+
+def test_search_fields_are_normalized():
+    assert search_fields(" Report.PDF ") == {"search_name": "report.pdf", "search_grams": sorted({"rep", "epo", "por", "ort", "rt.", "t.p", ".pd", "pdf"})}
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+
+import pytest
+from bson import ObjectId
+
+import utility.storage as storage
+import utility.versions as versions_module
+from fakes import FakeCollection
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    shared_gridfs_id = ObjectId()
+    collection = FakeCollection([{"_id": "sha-shared", "gridfs_id": shared_gridfs_id, "length": 10, "ref_count": 3}])
+    monkeypatch.setattr(storage, "blobs_collection", collection)
+    monkeypatch.setattr(storage, "orphaned_gridfs_collection", FakeCollection())
+    return collection
+
+
+def shared_row(blobs):
+    return {"_id": ObjectId(), "sha256": "sha-shared", "gridfs_id": blobs.documents["sha-shared"]["gridfs_id"]}
+
+
+def test_release_drops_one_reference_per_row(blobs):
+    asyncio.run(storage.release_blobs([shared_row(blobs), shared_row(blobs)]))
+    assert blobs.documents["sha-shared"]["ref_count"] == 1
+    assert not storage.orphaned_gridfs_collection.documents
+
+
+def test_rows_stored_before_deduplication_queue_their_own_gridfs_file(blobs):
+    legacy_gridfs_id, other_gridfs_id = ObjectId(), ObjectId()
+    rows = [
+        {"_id": ObjectId(), "gridfs_id": legacy_gridfs_id},
+        # same hash as a blob but a GridFS file of its own, e.g. uploaded before the blob existed
+        {"_id": ObjectId(), "sha256": "sha-shared", "gridfs_id": other_gridfs_id},
+    ]
+    asyncio.run(storage.release_blobs(rows))
+    assert blobs.documents["sha-shared"]["ref_count"] == 3
+    assert set(storage.orphaned_gridfs_collection.documents) == {legacy_gridfs_id, other_gridfs_id}
+
+
+def test_split_saved_keeps_rows_the_server_stored():
+    stored = {"_id": ObjectId(), "sha256": "sha-shared"}
+    lost = {"_id": ObjectId(), "sha256": "sha-shared"}
+    never_sent = {"sha256": "sha-shared"}
+    files = FakeCollection([stored])
+    saved, unsaved = asyncio.run(storage.split_saved(files, [stored, lost, never_sent]))
+    assert saved == [stored]
+    assert unsaved == [lost, never_sent]
+
+
+def test_partial_insert_releases_only_missing_rows(blobs):
+    rows = [shared_row(blobs), shared_row(blobs), shared_row(blobs)]
+    files = FakeCollection(rows[:1])   # an ordered insert_many that stopped after the first row
+
+    async def discard():
+        saved, unsaved = await storage.split_saved(files, rows)
+        await storage.release_blobs(unsaved)
+        return saved
+
+    assert asyncio.run(discard()) == rows[:1]
+    assert blobs.documents["sha-shared"]["ref_count"] == 1
+
+
+class FakeUpload:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.position = 0
+
+    async def read(self, size: int):
+        chunk = self.content[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    async def seek(self, position: int):
+        self.position = position
+
+
+def test_storing_known_content_adds_a_reference(blobs):
+    content = b"same bytes"
+    sha = hashlib.sha256(content).hexdigest()
+    blobs.documents[sha] = {"_id": sha, "gridfs_id": ObjectId(), "ref_count": 1}
+    gridfs_id, size, file_hash, deduplicated = asyncio.run(storage.store_blob(FakeUpload(content), "a.pdf", "application/pdf"))
+    assert deduplicated and size == len(content)
+    assert blobs.documents[file_hash]["ref_count"] == 2
+    assert gridfs_id == blobs.documents[file_hash]["gridfs_id"]
+
+
+def test_overlapping_claims_release_each_row_once(blobs):
+    rows = [shared_row(blobs), shared_row(blobs)]
+    trash = FakeCollection(rows)
+
+    async def purge_twice():
+        # both callers read the same rows before either deletes them
+        first = await storage.claim_rows(trash, rows)
+        second = await storage.claim_rows(trash, rows)
+        await storage.release_blobs(first)
+        await storage.release_blobs(second)
+        return first, second
+
+    first, second = asyncio.run(purge_twice())
+    assert first == rows and second == []
+    assert blobs.documents["sha-shared"]["ref_count"] == 1
+
+
+def test_purging_versions_twice_releases_them_once(blobs, monkeypatch):
+    file_id = ObjectId()
+    versions = FakeCollection([{**shared_row(blobs), "file_id": file_id, "version": version} for version in (1, 2)])
+    monkeypatch.setattr(versions_module, "file_versions_collection", versions)
+
+    async def purge_concurrently():
+        return await asyncio.gather(versions_module.purge_versions([file_id]), versions_module.purge_versions([file_id]))
+
+    assert sorted(asyncio.run(purge_concurrently())) == [0, 2]
+    assert blobs.documents["sha-shared"]["ref_count"] == 1
+    assert not versions.documents
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import utility.trash as trash
+import utility.usage as usage
+import utility.folder_tree as folder_tree
+from fakes import FakeCollection
+
+
+@pytest.fixture
+def tree(monkeypatch):
+    # root > a > b, with one 10 byte file in b uploaded by someuser
+    root, a, b, file_id = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    one_file = {"file_count": 1, "total_bytes": 10}
+    folders = FakeCollection([
+        {"_id": root, "name": "Desktop", "parent_folder_id": None, "ancestors": [], "usage": dict(one_file)},
+        {"_id": a, "name": "aaa", "parent_folder_id": root, "ancestors": [root], "usage": dict(one_file)},
+        {"_id": b, "name": "bbb", "parent_folder_id": a, "ancestors": [root, a], "usage": dict(one_file)},
+    ])
+    files = FakeCollection([{"_id": file_id, "filename": "f.pdf", "folder_id": b, "ancestors": [root, a, b], "owner": "someuser", "length": 10}])
+    users = FakeCollection([{"_id": ObjectId(), "username": "someuser", "usage": dict(one_file)}])
+    collections = {
+        "folders": folders, "files": files, "users": users,
+        "trashed_folders": FakeCollection(), "trashed_files": FakeCollection(),
+    }
+    for module in (trash, folder_tree, usage):
+        monkeypatch.setattr(module, "folders_collection", folders)
+    for module in (trash, usage):
+        monkeypatch.setattr(module, "files_metadata_collection", files)
+    monkeypatch.setattr(usage, "users_collection", users)
+    monkeypatch.setattr(trash, "trashed_folders_collection", collections["trashed_folders"])
+    monkeypatch.setattr(trash, "trashed_files_collection", collections["trashed_files"])
+    return collections, (root, a, b, file_id)
+
+
+def user_usage(collections):
+    (user,) = collections["users"].documents.values()
+    return user["usage"]["file_count"], user["usage"]["total_bytes"]
+
+
+def test_second_delete_of_the_same_folder_is_refused(tree):
+    collections, (root, a, b, file_id) = tree
+
+    async def delete_twice():
+        return await asyncio.gather(
+            trash.trash_folder_tree({}, a, "admin"), trash.trash_folder_tree({}, a, "admin"), return_exceptions=True
+        )
+
+    results = asyncio.run(delete_twice())
+    assert sum(isinstance(result, ValueError) for result in results) == 1
+    assert user_usage(collections) == (0, 0)
+    assert collections["trashed_files"].documents[file_id]["trash_id"] == a
+
+
+def test_delete_overlapping_a_running_delete_below_it_is_refused_and_unmarked(tree):
+    collections, (root, a, b, file_id) = tree
+    collections["folders"].documents[b]["deleting"] = True
+
+    with pytest.raises(ValueError):
+        asyncio.run(trash.trash_folder_tree({}, a, "admin"))
+    assert "deleting" not in collections["folders"].documents[a]
+    assert file_id in collections["files"].documents
+
+
+def test_job_overlaps_sees_parents_and_subfolders(tree):
+    collections, (root, a, b, file_id) = tree
+    collections["folders"].documents[a]["deleting"] = True
+    folders = collections["folders"].documents
+    assert asyncio.run(folder_tree.job_overlaps(folders[b]))
+    assert asyncio.run(folder_tree.job_overlaps(folders[root]))
+    assert asyncio.run(folder_tree.job_overlaps(folders[a]))
+    assert not asyncio.run(folder_tree.job_overlaps(folders[a], include_self=False))
+
+
+@pytest.fixture
+def expired_file(tree, monkeypatch):
+    import utility.storage as storage
+    import utility.versions as versions
+    collections, (root, a, b, file_id) = tree
+    gridfs_id = ObjectId()
+    blobs = FakeCollection([{"_id": "sha", "gridfs_id": gridfs_id, "ref_count": 1}])
+    monkeypatch.setattr(storage, "blobs_collection", blobs)
+    monkeypatch.setattr(storage, "orphaned_gridfs_collection", FakeCollection())
+    monkeypatch.setattr(versions, "file_versions_collection", FakeCollection())
+    monkeypatch.setattr(trash, "GC_BATCH_PAUSE_SECONDS", 0)
+
+    row = collections["files"].documents[file_id]
+    row.update({"sha256": "sha", "gridfs_id": gridfs_id})
+    asyncio.run(trash.trash_file(dict(row), "admin"))
+    asyncio.run(trash.expire_trash(file_id))
+    return collections, blobs, collections["trashed_files"].documents[file_id]
+
+
+def test_restore_racing_the_garbage_collector_keeps_the_reference(expired_file, tree):
+    collections, blobs, trashed = expired_file
+    folder = collections["folders"].documents[trashed["folder_id"]]
+
+    async def purge_and_restore():
+        return await asyncio.gather(trash.purge_expired_trash(), trash.restore_file(trashed, folder))
+
+    _, restored = asyncio.run(purge_and_restore())
+    assert restored
+    assert trashed["_id"] in collections["files"].documents
+    assert blobs.documents["sha"]["ref_count"] == 1
+
+
+def test_restore_after_the_garbage_collector_took_the_entry_is_refused(expired_file, tree):
+    collections, blobs, trashed = expired_file
+    folder = collections["folders"].documents[trashed["folder_id"]]
+    asyncio.run(trash.purge_expired_trash())
+
+    assert not asyncio.run(trash.restore_file(trashed, folder))
+    assert trashed["_id"] not in collections["files"].documents
+    assert blobs.documents["sha"]["ref_count"] == 0
+
+
+def usage_snapshot(collections):
+    counts = {folder_id: (folder["usage"]["file_count"], folder["usage"]["total_bytes"]) for folder_id, folder in collections["folders"].documents.items()}
+    return counts, user_usage(collections)
+
+
+def test_trashing_and_restoring_a_tree_gives_back_the_usage(tree):
+    collections, (root, a, b, file_id) = tree
+    before = usage_snapshot(collections)
+
+    asyncio.run(trash.trash_folder_tree({}, a, "admin"))
+    assert usage_snapshot(collections) == ({root: (0, 0)}, (0, 0))
+
+    result = asyncio.run(trash.restore_folder_tree({}, a))
+    assert result["files_restored"] == 1 and result["folders_restored"] == 2
+    assert usage_snapshot(collections) == before
+    assert collections["files"].documents[file_id]["ancestors"] == [root, a, b]
+    assert not collections["trashed_files"].documents and not collections["trashed_folders"].documents
+
+
+def test_trashing_and_restoring_a_file_gives_back_the_usage(tree):
+    collections, (root, a, b, file_id) = tree
+    before = usage_snapshot(collections)
+    file_metadata = collections["files"].documents[file_id]
+
+    asyncio.run(trash.trash_file(file_metadata, "someuser"))
+    assert usage_snapshot(collections) == ({root: (0, 0), a: (0, 0), b: (0, 0)}, (0, 0))
+
+    trashed = collections["trashed_files"].documents[file_id]
+    assert asyncio.run(trash.restore_file(trashed, collections["folders"].documents[b]))
+    assert usage_snapshot(collections) == before
+    # a second restore of the same entry finds nothing to claim and counts nothing twice
+    assert not asyncio.run(trash.restore_file(trashed, collections["folders"].documents[b]))
+    assert usage_snapshot(collections) == before
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import utility.usage as usage
+from fakes import FakeCollection
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    # root > a and root > b, each folder starts with 2 files of 30 bytes below it, someuser uploaded all of them
+    root, a, b = ObjectId(), ObjectId(), ObjectId()
+    folders = FakeCollection([
+        {"_id": root, "ancestors": [], "usage": {"file_count": 2, "total_bytes": 30}},
+        {"_id": a, "ancestors": [root], "usage": {"file_count": 1, "total_bytes": 10}},
+        {"_id": b, "ancestors": [root], "usage": {"file_count": 1, "total_bytes": 20}},
+    ])
+    users = FakeCollection([
+        {"_id": ObjectId(), "username": "someuser", "usage": {"file_count": 2, "total_bytes": 30}},
+        {"_id": ObjectId(), "username": "otheruser"},
+    ])
+    monkeypatch.setattr(usage, "folders_collection", folders)
+    monkeypatch.setattr(usage, "users_collection", users)
+    return folders, users, (root, a, b)
+
+
+def folder_usage(folders, folder_id):
+    counts = folders.documents[folder_id]["usage"]
+    return counts["file_count"], counts["total_bytes"]
+
+
+def user_usage(users, username):
+    (user,) = [user for user in users.documents.values() if user["username"] == username]
+    return user.get("usage", {}).get("file_count", 0), user.get("usage", {}).get("total_bytes", 0)
+
+
+def row(folder_ids: list, owner: str | None, length: int):
+    return {"_id": ObjectId(), "ancestors": folder_ids, "owner": owner, "length": length}
+
+
+def test_files_added_counts_every_row_in_every_folder_above_it(counters):
+    folders, users, (root, a, b) = counters
+    asyncio.run(usage.files_added([row([root, a], "someuser", 5), row([root, a], "otheruser", 7)]))
+    assert folder_usage(folders, root) == (4, 42)
+    assert folder_usage(folders, a) == (3, 22)
+    assert folder_usage(folders, b) == (1, 20)
+    assert user_usage(users, "someuser") == (3, 35)
+    assert user_usage(users, "otheruser") == (1, 7)
+    assert folders.documents[a]["usage"]["last_modified"] is not None
+
+
+def test_files_removed_groups_rows_from_several_folders(counters):
+    folders, users, (root, a, b) = counters
+    asyncio.run(usage.files_removed([row([root, a], "someuser", 10), row([root, b], "someuser", 20)]))
+    assert folder_usage(folders, root) == (0, 0)
+    assert folder_usage(folders, a) == (0, 0)
+    assert folder_usage(folders, b) == (0, 0)
+    assert user_usage(users, "someuser") == (0, 0)
+
+
+def test_files_removed_with_sign_one_adds_rows_back(counters):
+    folders, users, (root, a, b) = counters
+    rows = [row([root, a], "someuser", 10)]
+    asyncio.run(usage.files_removed(rows))
+    asyncio.run(usage.files_removed(rows, 1))
+    assert folder_usage(folders, root) == (2, 30)
+    assert folder_usage(folders, a) == (1, 10)
+    assert user_usage(users, "someuser") == (2, 30)
+
+
+def test_rows_without_an_owner_only_count_for_folders(counters):
+    folders, users, (root, a, b) = counters
+    asyncio.run(usage.files_added([row([root, b], None, 4)]))
+    assert folder_usage(folders, b) == (2, 24)
+    assert user_usage(users, "someuser") == (2, 30)
+
+
+def test_file_replaced_keeps_the_count_and_moves_the_size_difference(counters):
+    folders, users, (root, a, b) = counters
+    old_row = row([root, a], "someuser", 10)
+    asyncio.run(usage.file_replaced(old_row, {**old_row, "length": 25}))
+    assert folder_usage(folders, root) == (2, 45)
+    assert folder_usage(folders, a) == (1, 25)
+    assert folder_usage(folders, b) == (1, 20)
+    assert user_usage(users, "someuser") == (2, 45)
+
+
+def test_file_replaced_by_another_user_moves_the_file_between_users(counters):
+    folders, users, (root, a, b) = counters
+    old_row = row([root, a], "someuser", 10)
+    asyncio.run(usage.file_replaced(old_row, {**old_row, "owner": "otheruser", "length": 4}))
+    assert folder_usage(folders, a) == (1, 4)
+    assert user_usage(users, "someuser") == (1, 20)
+    assert user_usage(users, "otheruser") == (1, 4)
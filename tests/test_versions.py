@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import utility.storage as storage
+import utility.versions as versions
+from fakes import FakeCollection
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    old_gridfs_id, new_gridfs_id = ObjectId(), ObjectId()
+    blobs = FakeCollection([
+        {"_id": "sha-old", "gridfs_id": old_gridfs_id, "ref_count": 1},
+        {"_id": "sha-new", "gridfs_id": new_gridfs_id, "ref_count": 1},
+    ])
+    current = {"_id": ObjectId(), "filename": "a.pdf", "gridfs_id": old_gridfs_id, "sha256": "sha-old", "length": 3, "version": 1}
+    files = FakeCollection([current])
+    monkeypatch.setattr(storage, "blobs_collection", blobs)
+    monkeypatch.setattr(storage, "orphaned_gridfs_collection", FakeCollection())
+    monkeypatch.setattr(versions, "files_metadata_collection", files)
+    monkeypatch.setattr(versions, "file_versions_collection", FakeCollection())
+    metadata = {"gridfs_id": new_gridfs_id, "sha256": "sha-new", "length": 5}
+    return current, metadata, files, blobs
+
+
+def test_new_version_swaps_the_content_and_keeps_the_old_one(stored):
+    current, metadata, files, blobs = stored
+    assert asyncio.run(versions.add_version(current, metadata)) == 2
+    assert files.documents[current["_id"]]["sha256"] == "sha-new"
+    (old_version,) = versions.file_versions_collection.documents.values()
+    assert (old_version["version"], old_version["sha256"]) == (1, "sha-old")
+
+
+def test_failed_pruning_does_not_fail_a_committed_version(stored, monkeypatch):
+    current, metadata, files, blobs = stored
+
+    async def failing_prune(file_id):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(versions, "prune_versions", failing_prune)
+    assert asyncio.run(versions.add_version(current, metadata)) == 2
+    assert files.documents[current["_id"]]["version"] == 2
+    assert blobs.documents["sha-new"]["ref_count"] == 1
+
+
+def test_concurrent_replacement_is_rejected_and_its_version_removed(stored):
+    current, metadata, files, blobs = stored
+    files.documents[current["_id"]]["version"] = 2   # another upload swapped first
+    with pytest.raises(versions.HTTPException) as error:
+        asyncio.run(versions.add_version(current, metadata))
+    assert error.value.status_code == 409
+    assert not versions.file_versions_collection.documents
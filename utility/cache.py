@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    # small bounded least-recently-used cache, safe to use from the event loop and worker threads.
+    # entries can carry an expiry (epoch seconds) after which they count as missing
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                value, expires_at = self._items[key]
+                if expires_at is None or expires_at > time.time():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._items[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at: float | None = None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)  # drops the least recently used entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -3,6 +3,7 @@ import cv2
 import io
 
 def capture_image():
+    # local helper for clients: the api itself never opens a camera, it receives the captured frame
     cam = cv2.VideoCapture(0)  #starting of the camera 0 defines the default number of camera 
     if not cam.isOpened():
         raise HTTPException(status_code=500, detail="Failed to open the camera")
@@ -10,6 +11,8 @@ def capture_image():
     while True:  #this is an infinite loop where it takes continuous images 
         ret, frame = cam.read()  #frame contains image data and ret indicates if the frame is succesfully captured 
         if not ret:
+            cam.release()
+            cv2.destroyAllWindows()
             raise HTTPException(status_code=500, detail="Failed to capture image")
         cv2.imshow("Camera - Press 'c' to capture, 'q' to quit", frame)  #this is to show on the camera display
         key = cv2.waitKey(1)   #it check every 1 millisecond for key press 
@@ -18,10 +21,11 @@ def capture_image():
 
             success, buffer = cv2.imencode('.jpg', frame)   #converts the captured frame into jpeg format and stores it in memory
 
+            cam.release()  #the camera is released before returning so the next capture can open it
+            cv2.destroyAllWindows()
             if not success:
                 raise HTTPException(status_code=500, detail = "Failed to encode image") 
             
-            cv2.destroyAllWindows()   
             return io.BytesIO(buffer).getvalue()   #returns the image as byte stream 
         
         elif key == ord('q'):
@@ -0,0 +1,56 @@
+import numpy as np
+from functools import lru_cache
+from bson.binary import Binary
+from fastapi import HTTPException
+from configuration.settings import FACE_AUTH_ENABLED, FACE_ENCODING_CACHE_SIZE, FACE_DETECTION_MAX_SIDE, FACE_DETECTION_UPSAMPLE
+from utility.cache import LRUCache
+
+# enrolled face encodings keyed by the user's image_id, so login does not decode the signup photo again.
+# re-enrolling stores a new photo under a new image_id, which every worker then misses on its next login
+face_encoding_cache = LRUCache(FACE_ENCODING_CACHE_SIZE)
+
+
+@lru_cache(maxsize=None)
+def face_libraries():
+    # imported on first use: face_recognition loads the dlib models on import, which is most of the startup time and memory
+    if not FACE_AUTH_ENABLED:
+        raise HTTPException(status_code=503, detail="Face authentication is not enabled on this server")
+    import cv2
+    import face_recognition
+    return cv2, face_recognition
+
+
+def encode_face(image_bytes: bytes):
+    # cpu bound: returns the 128-d encoding of the largest face in the image, or None
+    cv2, face_recognition = face_libraries()
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    # HOG detection cost grows with the pixel count, so big photos are shrunk first
+    height, width = image.shape[:2]
+    scale = FACE_DETECTION_MAX_SIDE / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    locations = face_recognition.face_locations(image, number_of_times_to_upsample=FACE_DETECTION_UPSAMPLE, model="hog")
+    if not locations:
+        return None
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))   # (top, right, bottom, left)
+    encodings = face_recognition.face_encodings(image, known_face_locations=[largest])
+    if not encodings:
+        return None
+    return np.asarray(encodings[0], dtype=np.float32)
+
+
+def encoding_to_binary(encoding):
+    return Binary(np.asarray(encoding, dtype=np.float32).tobytes())  # 128 float32 values = 512 bytes
+
+
+def binary_to_encoding(data: bytes):
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def face_distance(stored_encoding, captured_encoding):
+    return float(np.linalg.norm(np.asarray(stored_encoding, dtype=np.float32) - captured_encoding))
@@ -0,0 +1,75 @@
+import time
+from pymongo.errors import PyMongoError
+from configuration.database import folders_collection
+from configuration.settings import FOLDER_CACHE_ENABLED, FOLDER_CACHE_SIZE, FOLDER_CHILD_NAMES_CACHE_SIZE, FOLDER_CACHE_CHANGE_STREAMS, FOLDER_CACHE_TTL_SECONDS
+from utility.cache import LRUCache
+
+# folder documents by id and the set of subfolder names by parent id.
+# handlers that change folders invalidate the entries they touch (write-through), and
+# watch_folder_changes() does the same for writes made by other workers when change streams are enabled.
+# without change streams entries expire after FOLDER_CACHE_TTL_SECONDS, which bounds how long a move or delete
+# made by another worker stays unseen. handlers that copy "ancestors" into new documents read with fresh=True
+folder_cache = LRUCache(FOLDER_CACHE_SIZE if FOLDER_CACHE_ENABLED else 0)
+child_names_cache = LRUCache(FOLDER_CHILD_NAMES_CACHE_SIZE if FOLDER_CACHE_ENABLED else 0)
+
+
+def cache_expiry():
+    return None if FOLDER_CACHE_CHANGE_STREAMS else time.time() + FOLDER_CACHE_TTL_SECONDS
+
+
+async def get_folder(folder_id, fresh: bool = False):
+    folder = None if fresh else folder_cache.get(folder_id)
+    if folder is None:
+        folder = await folders_collection.find_one({"_id": folder_id})
+        if folder:
+            folder_cache.set(folder_id, folder, expires_at=cache_expiry())
+        else:
+            folder_cache.invalidate(folder_id)
+    return folder
+
+
+async def get_child_names(parent_id):
+    names = child_names_cache.get(parent_id)
+    if names is None:
+        names = set(await folders_collection.distinct("name", {"parent_folder_id": parent_id}))
+        child_names_cache.set(parent_id, names, expires_at=cache_expiry())
+    return names
+
+
+def folder_created(folder: dict):
+    names = child_names_cache.get(folder["parent_folder_id"])
+    if names is not None:
+        names.add(folder["name"])
+
+
+def folder_changed(folder_id, parent_id=None):
+    # after a rename or delete of one folder
+    folder_cache.invalidate(folder_id)
+    child_names_cache.invalidate(parent_id)
+
+
+def subtree_changed():
+    # moves and recursive deletes rewrite many folders at once, start over
+    folder_cache.clear()
+    child_names_cache.clear()
+
+
+def cache_stats():
+    return {"enabled": FOLDER_CACHE_ENABLED, "folders": folder_cache.stats(), "child_names": child_names_cache.stats()}
+
+
+async def watch_folder_changes():
+    # needs a replica set, keeps caches of several workers coherent with each other
+    try:
+        async with folders_collection.watch(full_document="updateLookup") as stream:
+            async for change in stream:
+                folder = change.get("fullDocument")
+                folder_cache.invalidate(change["documentKey"]["_id"])
+                moved = "parent_folder_id" in change.get("updateDescription", {}).get("updatedFields", {})
+                if folder and change["operationType"] in ("insert", "update") and not moved:
+                    child_names_cache.invalidate(folder.get("parent_folder_id"))
+                else:
+                    child_names_cache.clear()   # deletes, replaces and moves do not tell us the old parent
+    except PyMongoError as e:
+        subtree_changed()
+        print(f"Folder change stream stopped, cache is only invalidated by this worker now: {e}")
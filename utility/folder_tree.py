@@ -0,0 +1,134 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+from configuration.database import folders_collection, files_metadata_collection
+from configuration.settings import BULK_DELETE_BATCH_SIZE
+from utility.folder_cache import subtree_changed
+from utility.usage import apply_usage
+
+# every folder and file keeps "ancestors": the ids from the root down to its parent folder (files include their own folder),
+# so a subtree is one indexed {"ancestors": folder_id} query and a breadcrumb is one $in lookup
+
+
+def batches(items: list, size: int = BULK_DELETE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def child_ancestors(folder: dict):
+    # ancestors for anything created directly inside folder
+    return folder.get("ancestors", []) + [folder["_id"]]
+
+
+def is_same_or_ancestor(folder_id: ObjectId, other_folder: dict):
+    # true when folder_id is other_folder itself or one of its parents
+    return folder_id == other_folder["_id"] or folder_id in other_folder.get("ancestors", [])
+
+
+# a recursive delete or a move sets one of these on the folder it works on while it runs.
+# only one job may hold a subtree, and writes below a marked folder are refused
+JOB_MARKS = ("deleting", "moving")
+MARKED = {"$or": [{mark: True} for mark in JOB_MARKS]}
+
+
+async def claim_folder(folder_id: ObjectId, mark: str):
+    # false when the folder is gone or another job holds it already
+    claimed = await folders_collection.update_one(
+        {"_id": folder_id, **{other: {"$ne": True} for other in JOB_MARKS}}, {"$set": {mark: True}}
+    )
+    return bool(claimed.matched_count)
+
+
+async def release_folder(folder_id: ObjectId, mark: str):
+    await folders_collection.update_one({"_id": folder_id}, {"$unset": {mark: ""}})
+
+
+async def is_busy(folder: dict):
+    # true while a delete or move runs on the folder or one of its parents
+    return await folders_collection.find_one({"_id": {"$in": child_ancestors(folder)}, **MARKED}, {"_id": 1}) is not None
+
+
+async def job_overlaps(folder: dict, include_self: bool = True):
+    # true while a delete or move runs on the folder, one of its parents or one of its subfolders
+    above = child_ancestors(folder) if include_self else folder.get("ancestors", [])
+    return await folders_collection.find_one(
+        {"$and": [{"$or": [{"_id": {"$in": above}}, {"ancestors": folder["_id"]}]}, MARKED]}, {"_id": 1}
+    ) is not None
+
+
+async def move_folder_tree(job: dict, folder_id: ObjectId, new_parent_id: ObjectId):
+    folder = await folders_collection.find_one({"_id": folder_id}, {"ancestors": 1, "usage": 1})
+    if not folder or not await claim_folder(folder_id, "moving"):
+        raise ValueError("Folder no longer exists or is already being moved or deleted.")
+    try:
+        return await move_marked_tree(folder, new_parent_id)
+    finally:
+        await release_folder(folder_id, "moving")
+
+
+async def move_marked_tree(folder: dict, new_parent_id: ObjectId):
+    folder_id = folder["_id"]
+    # checked again now that the folder is claimed: two moves accepted at the same time (a into b, b into a)
+    # both passed the handler's check. each one holds its mark until it is done, so at least one of them sees the other
+    new_parent = await folders_collection.find_one({"_id": new_parent_id}, {"ancestors": 1})
+    if not new_parent:
+        raise ValueError("Destination folder no longer exists.")
+    if is_same_or_ancestor(folder_id, new_parent):
+        raise ValueError("A folder cannot be moved into itself or one of its subfolders.")
+    if await job_overlaps(folder, include_self=False) or await is_busy(new_parent):
+        raise ValueError("The folder or the destination folder is being moved or deleted.")
+
+    old_depth = len(folder.get("ancestors", []))
+    new_ancestors = child_ancestors(new_parent)
+    # only from the path this job read, a folder moved in between is left alone
+    moved = await folders_collection.update_one(
+        {"_id": folder_id, "ancestors": folder.get("ancestors", [])},
+        {"$set": {"parent_folder_id": new_parent_id, "ancestors": new_ancestors}}
+    )
+    if not moved.matched_count:
+        raise ValueError("Folder was moved by someone else in the meantime.")
+
+    # descendants keep the part of their path below the moved folder and get the new prefix in front of it
+    rewrite_ancestors = [{"$set": {"ancestors": {"$concatArrays": [
+        {"$literal": new_ancestors},
+        {"$slice": ["$ancestors", old_depth, {"$size": "$ancestors"}]},
+    ]}}}]
+    folders_result = await folders_collection.update_many({"ancestors": folder_id}, rewrite_ancestors)
+    files_result = await files_metadata_collection.update_many({"ancestors": folder_id}, rewrite_ancestors)
+    subtree_changed()
+
+    # the subtree's usage leaves the old parents and is added to the new ones
+    usage = folder.get("usage", {})
+    await apply_usage(folder.get("ancestors", []), -usage.get("file_count", 0), -usage.get("total_bytes", 0))
+    await apply_usage(new_ancestors, usage.get("file_count", 0), usage.get("total_bytes", 0))
+    return {
+        "folder_id": str(folder_id),
+        "parent_folder_id": str(new_parent_id),
+        "folders_updated": folders_result.modified_count + 1,
+        "files_updated": files_result.modified_count,
+    }
+
+
+async def backfill_ancestors():
+    # fills "ancestors" on documents written before the field existed, walking the tree one level at a time
+    if not await folders_collection.find_one({"ancestors": {"$exists": False}}, {"_id": 1}):
+        if not await files_metadata_collection.find_one({"ancestors": {"$exists": False}}, {"_id": 1}):
+            return
+
+    level = await folders_collection.find({"parent_folder_id": None}, {"ancestors": 1}).to_list(length=None)
+    await folders_collection.update_many({"parent_folder_id": None}, {"$set": {"ancestors": []}})
+    while level:
+        ancestors_by_parent = {folder["_id"]: child_ancestors(folder) for folder in level}
+        children = await folders_collection.find(
+            {"parent_folder_id": {"$in": list(ancestors_by_parent)}}, {"parent_folder_id": 1}
+        ).to_list(length=None)
+        for batch in batches(children):
+            await folders_collection.bulk_write([
+                UpdateOne({"_id": child["_id"]}, {"$set": {"ancestors": ancestors_by_parent[child["parent_folder_id"]]}})
+                for child in batch
+            ])
+        for folder in level:
+            await files_metadata_collection.update_many(
+                {"folder_id": folder["_id"], "ancestors": {"$exists": False}},
+                {"$set": {"ancestors": ancestors_by_parent[folder["_id"]]}}
+            )
+        level = [{"_id": child["_id"], "ancestors": ancestors_by_parent[child["parent_folder_id"]]} for child in children]
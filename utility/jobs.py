@@ -0,0 +1,45 @@
+import asyncio
+import uuid
+from datetime import datetime
+from configuration.settings import JOB_HISTORY_SIZE
+from utility.cache import LRUCache
+from utility.metrics import current_request
+
+# in-process registry of background jobs, old entries fall out once the history is full
+jobs = LRUCache(JOB_HISTORY_SIZE)
+_running_tasks = set()   # keeps a reference so running tasks are not garbage collected
+
+
+def start_job(kind: str, job_func, *args):
+    # job_func(job, *args) is awaited in the background and may update job["progress"]
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "pending",
+        "progress": {},
+        "result": None,
+        "error": None,
+        "created_at": datetime.now(),
+        "finished_at": None,
+    }
+    jobs.set(job["id"], job)
+
+    async def run():
+        current_request.set(None)   # the task copied the request's context, its work is not part of that request
+        job["status"] = "running"
+        try:
+            job["result"] = await job_func(job, *args)
+            job["status"] = "completed"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+        job["finished_at"] = datetime.now()
+
+    task = asyncio.create_task(run())
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return job
+
+
+def get_job(job_id: str):
+    return jobs.get(job_id)
@@ -0,0 +1,183 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from pymongo import monitoring
+from configuration.settings import SLOW_REQUEST_MS
+
+# minimal Prometheus text-format metrics, no client library needed.
+# every request gets a stage breakdown (jwt, mongo, gridfs, bcrypt, ...) through a context variable,
+# filled in by stage() blocks and by the Mongo command listener
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+slow_request_logger = logging.getLogger("filemanager.slow_requests")
+current_request = ContextVar("current_request", default=None)
+_metrics = []
+_collectors = []
+
+
+def format_labels(label_names: tuple, label_values: tuple, extra: str = ""):
+    parts = [f'{name}="{str(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name, self.help_text, self.label_names = name, help_text, label_names
+        self._values = {}
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help_text, self.label_names, self.buckets = name, help_text, label_names, buckets
+        self._series = {}   # label values -> [bucket counts, sum, count]
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                bucket_labels = format_labels(self.label_names, label_values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            bucket_labels = format_labels(self.label_names, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, label_values)} {count}")
+        return lines
+
+
+request_seconds = Histogram("filemanager_request_seconds", "Request latency including the streamed body", ("method", "route", "status"))
+stage_seconds = Histogram("filemanager_stage_seconds", "Time spent per stage inside requests", ("route", "stage"))
+request_mongo_operations = Histogram("filemanager_request_mongo_operations", "Mongo commands issued per request", ("route",), COUNT_BUCKETS)
+mongo_command_seconds = Histogram("filemanager_mongo_command_seconds", "Mongo command round-trip time", ("command",))
+bytes_streamed = Counter("filemanager_bytes_streamed_total", "Request and response body bytes", ("route", "direction"))
+
+
+def register_collector(collect):
+    # collect() returns [(name, type, help, [(labels dict, value), ...]), ...] rendered on every scrape
+    _collectors.append(collect)
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, metric_type, help_text, samples in collect():
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"])
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def record_stage(name: str, seconds: float):
+    request = current_request.get()
+    if request is not None:
+        request["stages"][name] = request["stages"].get(name, 0.0) + seconds
+        request["calls"][name] = request["calls"].get(name, 0) + 1
+
+
+@contextmanager
+def stage(name: str):
+    # with stage("gridfs"): ... adds the block's time to the current request's breakdown
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    # registered on the client, counts every command including the ones Motor runs for GridFS
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_seconds.observe(seconds, event.command_name)
+        record_stage("mongo", seconds)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class MetricsMiddleware:
+    # plain ASGI middleware so the streamed request and response bodies are part of the measurement
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = {"stages": {}, "calls": {}, "status": 500, "bytes_in": 0, "bytes_out": 0}
+        token = current_request.set(request)
+        started = time.perf_counter()
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                request["bytes_in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                request["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                request["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            current_request.reset(token)
+            self.record(scope, request, time.perf_counter() - started)
+
+    def record(self, scope, request: dict, seconds: float):
+        route = getattr(scope.get("route"), "path", "unmatched")
+        request_seconds.observe(seconds, scope["method"], route, request["status"])
+        request_mongo_operations.observe(request["calls"].get("mongo", 0), route)
+        for name, stage_time in request["stages"].items():
+            stage_seconds.observe(stage_time, route, name)
+        bytes_streamed.inc(route, "in", amount=request["bytes_in"])
+        bytes_streamed.inc(route, "out", amount=request["bytes_out"])
+
+        if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+            slow_request_logger.warning(json.dumps({
+                "method": scope["method"],
+                "route": route,
+                "status": request["status"],
+                "ms": round(seconds * 1000, 1),
+                "stages_ms": {name: round(stage_time * 1000, 1) for name, stage_time in request["stages"].items()},
+                "calls": request["calls"],
+                "bytes_in": request["bytes_in"],
+                "bytes_out": request["bytes_out"],
+            }))
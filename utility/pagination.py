@@ -0,0 +1,44 @@
+import base64
+from bson import json_util
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+
+def encode_cursor(data: dict):
+    # json_util keeps ObjectId and datetime values intact inside the opaque token
+    return base64.urlsafe_b64encode(json_util.dumps(data).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: str):
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def keyset_filter(sort_field: str, last_value, last_id, descending: bool = False):
+    # documents strictly after (last_value, last_id) in the (sort_field, _id) order
+    compare = "$lt" if descending else "$gt"
+    if last_value is None:
+        # missing values sort first ascending and last descending
+        after_nulls = {"$or": [{sort_field: None, "_id": {compare: last_id}}]}
+        if not descending:
+            after_nulls["$or"].append({sort_field: {"$ne": None}})
+        return after_nulls
+    after_value = {"$or": [
+        {sort_field: {compare: last_value}},
+        {sort_field: last_value, "_id": {compare: last_id}},
+    ]}
+    if descending:
+        # $lt never matches null, but documents without the field still come after every value
+        after_value["$or"].append({sort_field: None})
+    return after_value
+
+
+async def fetch_page(collection, query: dict, sort_field: str, descending: bool, after: dict | None, limit: int, projection: dict):
+    # one page ordered by (sort_field, _id), starting after the cursor position when there is one
+    if after:
+        query = {"$and": [query, keyset_filter(sort_field, after["value"], after["id"], descending)]}
+    direction = DESCENDING if descending else ASCENDING
+    cursor = collection.find(query, {**projection, sort_field: 1}).sort([(sort_field, direction), ("_id", direction)]).limit(limit)
+    return await cursor.to_list(length=limit)
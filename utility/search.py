@@ -0,0 +1,52 @@
+import re
+import unicodedata
+from pymongo import UpdateOne
+from configuration.database import folders_collection, files_metadata_collection
+from configuration.settings import BULK_DELETE_BATCH_SIZE
+
+# names are searched through two stored fields:
+#   search_name  - normalized name, its index answers prefix queries (^...) and the sort order
+#   search_grams - distinct 3-character slices of search_name, a multikey index narrows substring queries
+#                  down to names containing every slice of the query before the exact regex check
+GRAM_SIZE = 3
+
+
+def normalize_name(name: str):
+    return unicodedata.normalize("NFKC", name).casefold().strip()
+
+
+def name_grams(normalized_name: str):
+    return sorted({normalized_name[start:start + GRAM_SIZE] for start in range(len(normalized_name) - GRAM_SIZE + 1)})
+
+
+def search_fields(name: str):
+    normalized_name = normalize_name(name)
+    return {"search_name": normalized_name, "search_grams": name_grams(normalized_name)}
+
+
+def name_query(text: str, mode: str):
+    normalized_text = normalize_name(text)
+    if mode == "prefix":
+        return {"search_name": {"$regex": "^" + re.escape(normalized_text)}}
+    if len(normalized_text) < GRAM_SIZE:
+        # too short to have a gram, the unanchored regex scans the search_name index instead
+        return {"search_name": {"$regex": re.escape(normalized_text)}}
+    return {
+        "search_grams": {"$all": name_grams(normalized_text)},
+        "search_name": {"$regex": re.escape(normalized_text)},
+    }
+
+
+async def backfill_search_fields():
+    # documents saved before search fields existed
+    for collection, name_field in ((folders_collection, "name"), (files_metadata_collection, "filename")):
+        while True:
+            documents = await collection.find(
+                {"search_name": {"$exists": False}}, {name_field: 1}
+            ).limit(BULK_DELETE_BATCH_SIZE).to_list(length=BULK_DELETE_BATCH_SIZE)
+            if not documents:
+                break
+            await collection.bulk_write([
+                UpdateOne({"_id": document["_id"]}, {"$set": search_fields(document.get(name_field, ""))})
+                for document in documents
+            ])
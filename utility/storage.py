@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+from collections import Counter
+from datetime import datetime
+from fastapi import HTTPException, UploadFile
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from configuration.database import blobs_collection, fs_bucket, gridfs_files_collection, gridfs_chunks_collection, orphaned_gridfs_collection
+from configuration.settings import UPLOAD_CHUNK_SIZE, MAX_UPLOAD_SIZE, GC_BATCH_SIZE, GC_BATCH_PAUSE_SECONDS
+
+# GridFS content is content addressed: blobs_collection has one document per distinct SHA-256
+# ({_id: sha256, gridfs_id, length, ref_count}) and every files_metadata, file_versions or trash row pointing at it
+# holds one reference. releasing the last one only marks the content as garbage, collect_garbage_blobs() deletes it later
+
+
+async def hash_upload(file: UploadFile):
+    # first pass over the spooled upload: size check and SHA-256 without touching GridFS
+    sha256 = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail=f"File is too large. Maximum allowed size is {MAX_UPLOAD_SIZE} bytes.")
+        sha256.update(chunk)
+    await file.seek(0)
+    return size, sha256.hexdigest()
+
+
+async def stream_to_gridfs(file: UploadFile, filename: str, metadata: dict):
+    # reads the upload chunk by chunk so only one chunk is held in memory at a time
+    grid_in = fs_bucket.open_upload_stream(filename, chunk_size_bytes=UPLOAD_CHUNK_SIZE, metadata=metadata)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()  # removes the chunks written so far
+        raise
+    await grid_in.close()
+    return grid_in._id
+
+
+async def store_blob(file: UploadFile, filename: str, content_type: str):
+    # returns (gridfs_id, size, sha256, deduplicated), new chunks are only written for content not stored yet
+    size, file_hash = await hash_upload(file)
+
+    existing_blob = await blobs_collection.find_one_and_update(
+        {"_id": file_hash}, {"$inc": {"ref_count": 1}}, projection={"gridfs_id": 1}
+    )
+    if existing_blob:
+        return existing_blob["gridfs_id"], size, file_hash, True
+
+    gridfs_id = await stream_to_gridfs(file, filename, {"content_type": content_type, "sha256": file_hash})
+    try:
+        await blobs_collection.insert_one({
+            "_id": file_hash,
+            "gridfs_id": gridfs_id,
+            "length": size,
+            "ref_count": 1,
+            "created_at": datetime.now(),
+        })
+    except DuplicateKeyError:
+        # the same content was stored by a concurrent upload, keep theirs and drop ours
+        await delete_gridfs_files([gridfs_id])
+        existing_blob = await blobs_collection.find_one_and_update(
+            {"_id": file_hash}, {"$inc": {"ref_count": 1}}, projection={"gridfs_id": 1}, return_document=ReturnDocument.AFTER
+        )
+        return existing_blob["gridfs_id"], size, file_hash, True
+    return gridfs_id, size, file_hash, False
+
+
+async def delete_gridfs_files(gridfs_ids: list):
+    if gridfs_ids:
+        # thumbnails generated from these files go with them
+        thumbnails = await gridfs_files_collection.find({"metadata.thumbnail_of": {"$in": gridfs_ids}}, {"_id": 1}).to_list(length=None)
+        gridfs_ids = gridfs_ids + [thumbnail["_id"] for thumbnail in thumbnails]
+        await gridfs_chunks_collection.delete_many({"files_id": {"$in": gridfs_ids}})
+        await gridfs_files_collection.delete_many({"_id": {"$in": gridfs_ids}})
+
+
+async def release_blobs(rows: list):
+    # drops one reference per row, unreferenced GridFS data is left for the garbage collector
+    shas = list({row["sha256"] for row in rows if row.get("sha256")})
+    blobs = await blobs_collection.find({"_id": {"$in": shas}}, {"gridfs_id": 1}).to_list(length=None) if shas else []
+    blob_gridfs_ids = {blob["_id"]: blob["gridfs_id"] for blob in blobs}
+
+    references = Counter()
+    unshared_gridfs_ids = []   # rows stored before deduplication own their GridFS file
+    for row in rows:
+        if row.get("sha256") in blob_gridfs_ids and blob_gridfs_ids[row["sha256"]] == row["gridfs_id"]:
+            references[row["sha256"]] += 1
+        else:
+            unshared_gridfs_ids.append(row["gridfs_id"])
+
+    if references:
+        await blobs_collection.bulk_write([
+            UpdateOne({"_id": sha}, {"$inc": {"ref_count": -count}}) for sha, count in references.items()
+        ])
+    if unshared_gridfs_ids:
+        await orphaned_gridfs_collection.bulk_write([
+            UpdateOne({"_id": gridfs_id}, {"$setOnInsert": {"queued_at": datetime.now()}}, upsert=True)
+            for gridfs_id in unshared_gridfs_ids
+        ])
+
+
+async def claim_rows(collection, rows: list):
+    # deletes the rows one by one and returns the ones this caller removed. only those may release their blobs,
+    # so two callers that read the same rows (several garbage collectors, overlapping uploads) never release twice.
+    # a crash before the release leaves one reference too many, which keeps data rather than losing it
+    claimed = []
+    for row in rows:
+        deleted = await collection.delete_one({"_id": row["_id"]})
+        if deleted.deleted_count == 1:
+            claimed.append(row)
+    return claimed
+
+
+async def split_saved(collection, rows: list):
+    # after a failed insert some rows may be stored anyway: the server applied it before a timeout, or an ordered
+    # insert_many stopped partway. insert_one/insert_many set "_id" on the rows they sent, so one lookup tells them apart.
+    # returns (saved, unsaved), rows that were never sent count as unsaved
+    sent_ids = [row["_id"] for row in rows if "_id" in row]
+    saved_ids = set(await collection.distinct("_id", {"_id": {"$in": sent_ids}})) if sent_ids else set()
+    return [row for row in rows if row.get("_id") in saved_ids], [row for row in rows if row.get("_id") not in saved_ids]
+
+
+async def collect_garbage_blobs():
+    # deletes GridFS data nothing refers to anymore, a batch at a time with a pause in between
+    # so fs.chunks deletes never run back to back with live traffic. returns the number of GridFS files removed
+    removed = 0
+    while True:
+        gridfs_ids = []
+        unreferenced = await blobs_collection.find({"ref_count": {"$lte": 0}}, {"gridfs_id": 1}).limit(GC_BATCH_SIZE).to_list(length=GC_BATCH_SIZE)
+        for blob in unreferenced:
+            # conditional delete so a blob picked up by a concurrent upload is kept
+            deleted = await blobs_collection.delete_one({"_id": blob["_id"], "ref_count": {"$lte": 0}})
+            if deleted.deleted_count:
+                gridfs_ids.append(blob["gridfs_id"])
+        orphaned = await orphaned_gridfs_collection.find({}, {"_id": 1}).limit(GC_BATCH_SIZE).to_list(length=GC_BATCH_SIZE)
+        gridfs_ids += [orphan["_id"] for orphan in orphaned]
+        if not unreferenced and not orphaned:
+            return removed
+
+        await delete_gridfs_files(gridfs_ids)
+        await orphaned_gridfs_collection.delete_many({"_id": {"$in": [orphan["_id"] for orphan in orphaned]}})
+        removed += len(gridfs_ids)
+        await asyncio.sleep(GC_BATCH_PAUSE_SECONDS)
+
+
+async def dedup_report():
+    pipeline = [{"$group": {
+        "_id": None,
+        "blobs": {"$sum": 1},
+        "references": {"$sum": "$ref_count"},
+        "stored_bytes": {"$sum": "$length"},
+        "logical_bytes": {"$sum": {"$multiply": ["$length", "$ref_count"]}},
+    }}]
+    result = await blobs_collection.aggregate(pipeline).to_list(length=1)
+    report = result[0] if result else {"blobs": 0, "references": 0, "stored_bytes": 0, "logical_bytes": 0}
+    report.pop("_id", None)
+    report["saved_bytes"] = report["logical_bytes"] - report["stored_bytes"]
+    return report
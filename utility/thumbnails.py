@@ -0,0 +1,74 @@
+import numpy as np
+from functools import lru_cache
+from configuration.database import fs_bucket, files_metadata_collection, blobs_collection
+from configuration.settings import THUMBNAIL_SIZES, THUMBNAIL_MAX_SOURCE_SIZE, THUMBNAIL_JPEG_QUALITY
+from utility.workers import media_pool
+
+@lru_cache(maxsize=None)
+def image_libraries():
+    # imported on first use, so workers that never render thumbnails do not load OpenCV
+    import cv2
+    try:
+        import fitz   # PyMuPDF, optional: only needed for first-page previews of PDFs
+    except ImportError:
+        fitz = None
+    return cv2, fitz
+
+
+def decode_source(data: bytes, content_type: str):
+    cv2, fitz = image_libraries()
+    if content_type == "application/pdf":
+        if fitz is None:
+            return None
+        with fitz.open(stream=data, filetype="pdf") as document:
+            if document.page_count == 0:
+                return None
+            data = document[0].get_pixmap().tobytes("png")   # first page only
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def render_thumbnails(data: bytes, content_type: str):
+    # cpu bound: returns {size: jpeg bytes}, the longest side of each thumbnail is at most size pixels
+    image = decode_source(data, content_type)
+    if image is None:
+        return {}
+    cv2, _ = image_libraries()
+    height, width = image.shape[:2]
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        scale = min(size / max(height, width), 1.0)
+        resized = cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
+        success, buffer = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+        if success:
+            thumbnails[size] = buffer.tobytes()
+    return thumbnails
+
+
+async def generate_thumbnails(job: dict, gridfs_id, content_type: str):
+    gridfs_file = await fs_bucket.open_download_stream(gridfs_id)
+    if gridfs_file.length > THUMBNAIL_MAX_SOURCE_SIZE:
+        return {"skipped": "source file is too large"}
+
+    rendered = await media_pool.run(render_thumbnails, await gridfs_file.read(), content_type)
+    thumbnails = {}
+    for size, data in rendered.items():
+        thumbnails[str(size)] = await fs_bucket.upload_from_stream(
+            f"thumbnail_{size}.jpg",
+            data,
+            metadata={"content_type": "image/jpeg", "thumbnail_of": gridfs_id, "size": size}
+        )
+
+    if thumbnails:
+        # every metadata row and the blob that share this content get the same thumbnails
+        await files_metadata_collection.update_many({"gridfs_id": gridfs_id}, {"$set": {"thumbnails": thumbnails}})
+        await blobs_collection.update_one({"gridfs_id": gridfs_id}, {"$set": {"thumbnails": thumbnails}})
+    return {"sizes": list(thumbnails)}
+
+
+def pick_thumbnail(thumbnails: dict, size: int):
+    # smallest thumbnail at least as big as requested, otherwise the biggest one there is
+    sizes = sorted(int(available) for available in thumbnails)
+    if not sizes:
+        return None
+    chosen = next((available for available in sizes if available >= size), sizes[-1])
+    return thumbnails[str(chosen)]
@@ -0,0 +1,256 @@
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReplaceOne
+from configuration.database import (
+    folders_collection, files_metadata_collection, trashed_folders_collection, trashed_files_collection,
+    blobs_collection, orphaned_gridfs_collection,
+)
+from configuration.settings import TRASH_RETENTION_DAYS, BULK_DELETE_BATCH_SIZE, GC_BATCH_SIZE, GC_BATCH_PAUSE_SECONDS, GC_INTERVAL_SECONDS
+from utility.folder_cache import folder_changed, subtree_changed
+from utility.folder_tree import child_ancestors, claim_folder, release_folder, job_overlaps
+from utility.storage import release_blobs, claim_rows, collect_garbage_blobs
+from utility.usage import apply_usage, apply_user_usage, files_removed
+from utility.versions import purge_versions
+
+# deleting moves documents unchanged into trash.folders / trash.files_metadata with a few extra fields.
+# everything deleted together shares one trash_id (the id of the deleted folder or file), which is what gets
+# restored or purged, and trash_root marks the document that was deleted itself. blobs keep their references
+# while in the trash, run_garbage_collector() purges expired entries and then the GridFS data nobody uses
+
+TRASH_FIELDS = ("trash_id", "trash_root", "deleted_at", "deleted_by", "expires_at", "deleting", "moving")
+
+# totals since this worker started, exported on /metrics and /admin/storage/gc
+gc_stats = {
+    "runs": 0,
+    "files_purged": 0,
+    "folders_purged": 0,
+    "versions_purged": 0,
+    "gridfs_files_removed": 0,
+    "last_run_at": None,
+    "last_error": None,
+}
+
+
+def trash_marks(trash_id: ObjectId, deleted_by: str | None):
+    now = datetime.now()
+    return {"trash_id": trash_id, "deleted_at": now, "deleted_by": deleted_by, "expires_at": now + timedelta(days=TRASH_RETENTION_DAYS)}
+
+
+def untrashed(document: dict):
+    return {key: value for key, value in document.items() if key not in TRASH_FIELDS}
+
+
+async def move_documents(source, target, documents: list):
+    # upserts first and deletes second, so running it again after a failure never loses a document
+    if documents:
+        await target.bulk_write([ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents])
+        await source.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+
+
+async def restore_documents(source, target, documents: list, restored):
+    # the reverse of move_documents for restores: each trash row is claimed (deleted) first and only the claimed ones
+    # are written back through restored(). the garbage collector claims rows the same way, so it never releases the
+    # content of a row that has just come back. returns the trash rows this caller claimed
+    claimed = await claim_rows(source, documents)
+    if claimed:
+        await target.bulk_write([ReplaceOne({"_id": document["_id"]}, restored(document), upsert=True) for document in claimed])
+    return claimed
+
+
+async def keep_while_restoring(trash_id: ObjectId):
+    # a restore gives the entry a fresh retention period, so the garbage collector does not start on it meanwhile
+    update = {"$set": {"expires_at": datetime.now() + timedelta(days=TRASH_RETENTION_DAYS)}}
+    await trashed_files_collection.update_many({"trash_id": trash_id}, update)
+    await trashed_folders_collection.update_many({"trash_id": trash_id}, update)
+
+
+async def trash_file(file_metadata: dict, deleted_by: str | None):
+    trashed = {**file_metadata, **trash_marks(file_metadata["_id"], deleted_by), "trash_root": True}
+    await move_documents(files_metadata_collection, trashed_files_collection, [trashed])
+    await files_removed([file_metadata])
+
+
+async def trash_folder(folder_id: ObjectId, deleted_by: str | None):
+    # an empty folder, bigger trees go through trash_folder_tree. read here rather than from the cache so usage is current
+    folder = await folders_collection.find_one({"_id": folder_id})
+    if not folder:
+        return False
+    trashed = {**folder, **trash_marks(folder["_id"], deleted_by), "trash_root": True}
+    await move_documents(folders_collection, trashed_folders_collection, [trashed])
+    folder_changed(folder["_id"], folder.get("parent_folder_id"))
+    return True
+
+
+async def trash_folder_tree(job: dict, folder_id: ObjectId, deleted_by: str | None):
+    # the mark is claimed before the first batch: only one delete runs per subtree, uploads and new folders below it
+    # are refused while the job runs, and the cached documents go so no worker keeps serving the subtree from memory.
+    # a failed job drops the mark again so the delete can simply be started again
+    folder = await folders_collection.find_one({"_id": folder_id}, {"ancestors": 1})
+    if not folder or not await claim_folder(folder_id, "deleting"):
+        raise ValueError("Folder no longer exists or is already being moved or deleted.")
+    try:
+        # two jobs started at once on a folder and one of its parents would both pass the handler's check
+        if await job_overlaps(folder, include_self=False):
+            raise ValueError("A parent folder or a subfolder is already being moved or deleted.")
+        subtree_changed()
+        return await trash_marked_tree(job, folder_id, deleted_by)
+    except BaseException:
+        await release_folder(folder_id, "deleting")
+        raise
+
+
+async def trash_marked_tree(job: dict, folder_id: ObjectId, deleted_by: str | None):
+    job["progress"] = {
+        "folders_total": await folders_collection.count_documents({"ancestors": folder_id}) + 1,
+        "folders_trashed": 0,
+        "files_trashed": 0,
+    }
+    marks = trash_marks(folder_id, deleted_by)
+
+    while True:
+        rows = await files_metadata_collection.find({"ancestors": folder_id}).limit(BULK_DELETE_BATCH_SIZE).to_list(length=BULK_DELETE_BATCH_SIZE)
+        if not rows:
+            break
+        await move_documents(files_metadata_collection, trashed_files_collection, [{**row, **marks} for row in rows])
+        await apply_user_usage(rows, -1)
+        job["progress"]["files_trashed"] += len(rows)
+
+    while True:
+        folder_batch = await folders_collection.find({"ancestors": folder_id}).limit(BULK_DELETE_BATCH_SIZE).to_list(length=BULK_DELETE_BATCH_SIZE)
+        if not folder_batch:
+            break
+        await move_documents(folders_collection, trashed_folders_collection, [{**folder, **marks} for folder in folder_batch])
+        job["progress"]["folders_trashed"] += len(folder_batch)
+
+    # the folder itself goes last so a failed job can simply be started again, its usage leaves the folders above it
+    folder = await folders_collection.find_one({"_id": folder_id})
+    if not folder:
+        raise ValueError("Folder no longer exists.")
+    usage = folder.get("usage", {})
+    await apply_usage(folder.get("ancestors", []), -usage.get("file_count", 0), -usage.get("total_bytes", 0))
+    await move_documents(folders_collection, trashed_folders_collection, [{**folder, **marks, "trash_root": True}])
+    subtree_changed()
+    job["progress"]["folders_trashed"] += 1
+    return {"trash_id": str(folder_id), "folders_trashed": job["progress"]["folders_trashed"], "files_trashed": job["progress"]["files_trashed"]}
+
+
+async def restore_file(trashed: dict, folder: dict):
+    # folder is the live folder the file goes back to, it may have been moved since the delete.
+    # false when the garbage collector or another restore took the entry first
+    def restored(document: dict):
+        return {**untrashed(document), "ancestors": child_ancestors(folder)}
+
+    if not await restore_documents(trashed_files_collection, files_metadata_collection, [trashed], restored):
+        return False
+    await files_removed([restored(trashed)], 1)
+    return True
+
+
+async def restore_folder_tree(job: dict, trash_id: ObjectId):
+    root = await trashed_folders_collection.find_one({"_id": trash_id, "trash_root": True})
+    parent = await folders_collection.find_one({"_id": root["parent_folder_id"]}, {"ancestors": 1}) if root else None
+    if not root or not parent:
+        raise ValueError("Folder or its parent folder no longer exists.")
+    job["progress"] = {"folders_restored": 0, "files_restored": 0}
+    await keep_while_restoring(trash_id)
+
+    # the parent may have moved while the folder was in the trash, paths below the folder stay as they were
+    old_depth = len(root.get("ancestors", []))
+    new_ancestors = child_ancestors(parent)
+
+    def restored(document: dict):
+        return {**untrashed(document), "ancestors": new_ancestors + document.get("ancestors", [])[old_depth:]}
+
+    while True:
+        rows = await trashed_files_collection.find({"trash_id": trash_id}).limit(BULK_DELETE_BATCH_SIZE).to_list(length=BULK_DELETE_BATCH_SIZE)
+        if not rows:
+            break
+        claimed = await restore_documents(trashed_files_collection, files_metadata_collection, rows, restored)
+        await apply_user_usage(claimed, 1)
+        job["progress"]["files_restored"] += len(claimed)
+
+    while True:
+        folder_batch = await trashed_folders_collection.find(
+            {"trash_id": trash_id, "_id": {"$ne": trash_id}}
+        ).limit(BULK_DELETE_BATCH_SIZE).to_list(length=BULK_DELETE_BATCH_SIZE)
+        if not folder_batch:
+            break
+        claimed = await restore_documents(trashed_folders_collection, folders_collection, folder_batch, restored)
+        job["progress"]["folders_restored"] += len(claimed)
+
+    # the folder itself comes back last, until then nothing of the tree is reachable from the live folders
+    if not await restore_documents(trashed_folders_collection, folders_collection, [root], restored):
+        raise ValueError("The folder was restored or purged by someone else in the meantime.")
+    usage = root.get("usage", {})
+    await apply_usage(new_ancestors, usage.get("file_count", 0), usage.get("total_bytes", 0))
+    subtree_changed()
+    job["progress"]["folders_restored"] += 1
+    return {"folder_id": str(trash_id), **job["progress"]}
+
+
+async def expire_trash(trash_id: ObjectId):
+    # purging is left to the garbage collector, this only makes the entry due now
+    update = {"$set": {"expires_at": datetime.now()}}
+    folders = await trashed_folders_collection.update_many({"trash_id": trash_id}, update)
+    files = await trashed_files_collection.update_many({"trash_id": trash_id}, update)
+    return folders.matched_count + files.matched_count
+
+
+async def purge_expired_trash():
+    # expired files release their content and their versions' content, then the rows go for good
+    now = datetime.now()
+    while True:
+        rows = await trashed_files_collection.find(
+            {"expires_at": {"$lte": now}}, {"gridfs_id": 1, "sha256": 1}
+        ).limit(GC_BATCH_SIZE).to_list(length=GC_BATCH_SIZE)
+        if not rows:
+            break
+        # versions first: if this stops halfway the trash rows are still there to find them again
+        gc_stats["versions_purged"] += await purge_versions([row["_id"] for row in rows])
+        purged = await claim_rows(trashed_files_collection, rows)
+        await release_blobs(purged)
+        gc_stats["files_purged"] += len(purged)
+        await asyncio.sleep(GC_BATCH_PAUSE_SECONDS)
+
+    # folders last, a folder is only purged once nothing below it is left
+    while True:
+        folder_batch = await trashed_folders_collection.find({"expires_at": {"$lte": now}}, {"_id": 1}).limit(GC_BATCH_SIZE).to_list(length=GC_BATCH_SIZE)
+        if not folder_batch:
+            break
+        await trashed_folders_collection.delete_many({"_id": {"$in": [folder["_id"] for folder in folder_batch]}})
+        gc_stats["folders_purged"] += len(folder_batch)
+
+
+async def collect_garbage():
+    await purge_expired_trash()
+    gc_stats["gridfs_files_removed"] += await collect_garbage_blobs()
+    gc_stats["runs"] += 1
+    gc_stats["last_run_at"] = datetime.now()
+
+
+async def run_garbage_collector():
+    # started by the lifespan hook. rows are claimed with a delete before their blobs are released,
+    # so several workers may run it at once without releasing a reference twice
+    while True:
+        try:
+            await collect_garbage()
+            gc_stats["last_error"] = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            gc_stats["last_error"] = str(e)
+            print(f"Garbage collection failed, retrying in {GC_INTERVAL_SECONDS} seconds: {e}")
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+
+
+async def garbage_report():
+    now = datetime.now()
+    return {
+        **gc_stats,
+        "trashed_files": await trashed_files_collection.count_documents({}),
+        "trashed_folders": await trashed_folders_collection.count_documents({}),
+        "expired_files": await trashed_files_collection.count_documents({"expires_at": {"$lte": now}}),
+        "unreferenced_blobs": await blobs_collection.count_documents({"ref_count": {"$lte": 0}}),
+        "orphaned_gridfs_files": await orphaned_gridfs_collection.count_documents({}),
+    }
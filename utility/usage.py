@@ -0,0 +1,135 @@
+from collections import defaultdict
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from configuration.database import folders_collection, users_collection, files_metadata_collection
+from configuration.settings import USER_QUOTA_BYTES
+
+# every folder has "usage" for everything below it (file_count, total_bytes, last_modified) and so does every user
+# for the files they uploaded. handlers keep both up to date with $inc, reconcile_usage() recomputes them from scratch
+
+
+def usage_update(file_count: int, total_bytes: int):
+    return {
+        "$inc": {"usage.file_count": file_count, "usage.total_bytes": total_bytes},
+        "$max": {"usage.last_modified": datetime.now()},
+    }
+
+
+async def apply_usage(folder_ids: list, file_count: int, total_bytes: int):
+    if folder_ids and (file_count or total_bytes):
+        await folders_collection.update_many({"_id": {"$in": folder_ids}}, usage_update(file_count, total_bytes))
+
+
+async def apply_user_usage(rows: list, sign: int):
+    # sign is 1 when rows were added and -1 when they were removed
+    per_owner = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row.get("owner"):
+            per_owner[row["owner"]][0] += 1
+            per_owner[row["owner"]][1] += row.get("length", 0)
+    if per_owner:
+        await users_collection.bulk_write([
+            UpdateOne({"username": owner}, usage_update(sign * count, sign * total))
+            for owner, (count, total) in per_owner.items()
+        ])
+
+
+async def files_added(rows: list):
+    # rows of one upload request, they all live in the same folder
+    await apply_usage(rows[0]["ancestors"], len(rows), sum(row.get("length", 0) for row in rows))
+    await apply_user_usage(rows, 1)
+
+
+async def files_removed(rows: list, sign: int = -1):
+    # rows may come from several folders, sign=1 adds them back (restore from the trash)
+    per_folder = defaultdict(lambda: [0, 0])
+    for row in rows:
+        for folder_id in row.get("ancestors", []):
+            per_folder[folder_id][0] += 1
+            per_folder[folder_id][1] += row.get("length", 0)
+    if per_folder:
+        await folders_collection.bulk_write([
+            UpdateOne({"_id": folder_id}, usage_update(sign * count, sign * total))
+            for folder_id, (count, total) in per_folder.items()
+        ])
+    await apply_user_usage(rows, sign)
+
+
+async def file_replaced(old_row: dict, new_row: dict):
+    # a new version of the same file: the count stays, the bytes change by the size difference
+    await apply_usage(new_row["ancestors"], 0, new_row.get("length", 0) - old_row.get("length", 0))
+    await apply_user_usage([old_row], -1)
+    await apply_user_usage([new_row], 1)
+
+
+async def check_quota(username: str, incoming_bytes: int):
+    # rejects before anything is hashed or written to GridFS
+    if USER_QUOTA_BYTES <= 0:
+        return
+    user = await users_collection.find_one({"username": username}, {"usage.total_bytes": 1})
+    used = (user or {}).get("usage", {}).get("total_bytes", 0)
+    if used + incoming_bytes > USER_QUOTA_BYTES:
+        raise HTTPException(
+            status_code=507,
+            detail=f"Storage quota exceeded. {max(USER_QUOTA_BYTES - used, 0)} bytes are left of {USER_QUOTA_BYTES}."
+        )
+
+
+def usage_of(document: dict | None):
+    usage = (document or {}).get("usage", {})
+    return {
+        "file_count": usage.get("file_count", 0),
+        "total_bytes": usage.get("total_bytes", 0),
+        "last_modified": usage.get("last_modified"),
+    }
+
+
+async def reconcile_usage(job: dict):
+    started_at = datetime.now()
+    totals = {
+        "file_count": {"$sum": 1},
+        "total_bytes": {"$sum": {"$ifNull": ["$length", 0]}},
+        "last_modified": {"$max": "$created_at"},
+    }
+
+    # folders: one pipeline computed and written back on the server
+    await files_metadata_collection.aggregate([
+        {"$unwind": "$ancestors"},
+        {"$group": {"_id": "$ancestors", **totals}},
+        {"$merge": {
+            "into": folders_collection.name,
+            "on": "_id",
+            "whenMatched": [{"$set": {"usage": {
+                "file_count": "$$new.file_count",
+                "total_bytes": "$$new.total_bytes",
+                "last_modified": "$$new.last_modified",
+                "reconciled_at": started_at,
+            }}}],
+            "whenNotMatched": "discard",
+        }},
+    ]).to_list(length=None)
+    # folders without any file below them were not touched by the pipeline
+    emptied = await folders_collection.update_many(
+        {"$or": [{"usage.reconciled_at": {"$lt": started_at}}, {"usage.reconciled_at": {"$exists": False}}]},
+        {"$set": {"usage": {"file_count": 0, "total_bytes": 0, "last_modified": None, "reconciled_at": started_at}}}
+    )
+
+    users = await files_metadata_collection.aggregate([
+        {"$match": {"owner": {"$ne": None}}},
+        {"$group": {"_id": "$owner", **totals}},
+    ]).to_list(length=None)
+    await users_collection.update_many(
+        {"username": {"$nin": [user["_id"] for user in users]}},
+        {"$set": {"usage": {"file_count": 0, "total_bytes": 0, "last_modified": None}}}
+    )
+    if users:
+        await users_collection.bulk_write([
+            UpdateOne({"username": user["_id"]}, {"$set": {"usage": {
+                "file_count": user["file_count"],
+                "total_bytes": user["total_bytes"],
+                "last_modified": user["last_modified"],
+            }}})
+            for user in users
+        ])
+    return {"empty_folders": emptied.modified_count, "users": len(users)}
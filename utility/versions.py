@@ -0,0 +1,79 @@
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from configuration.database import files_metadata_collection, file_versions_collection
+from configuration.settings import FILE_MAX_VERSIONS
+from utility.storage import release_blobs, claim_rows
+
+# uploading to a name that already exists in the folder keeps the files_metadata row (and its id) and swaps in
+# the new content. the content it replaced goes to file_versions ({file_id, version, gridfs_id, sha256, ...}),
+# which keeps its blob reference until the version is pruned or the file is purged from the trash
+
+VERSIONED_FIELDS = ("gridfs_id", "sha256", "length", "content_type", "owner", "thumbnails")
+
+
+async def add_version(current: dict, metadata: dict):
+    # returns the new version number, 409 when another upload replaced the file first
+    version = current.get("version", 1)
+    now = datetime.now()
+    previous = {field: current[field] for field in VERSIONED_FIELDS if field in current}
+    try:
+        # the unique (file_id, version) index lets only one of two concurrent uploads through
+        inserted = await file_versions_collection.insert_one({
+            "file_id": current["_id"],
+            "version": version,
+            **previous,
+            "created_at": current.get("updated_at", current.get("created_at")),
+            "replaced_at": now,
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="The file was replaced by another upload at the same time. Please retry.")
+
+    update = {"$set": {
+        **{field: metadata[field] for field in VERSIONED_FIELDS if field in metadata},
+        "version": version + 1,
+        "updated_at": now,
+    }}
+    if "thumbnails" not in metadata:
+        update["$unset"] = {"thumbnails": ""}   # thumbnails of the old content, the new ones come from the thumbnail job
+    # "version": None also matches rows uploaded before versions were tracked
+    try:
+        result = await files_metadata_collection.update_one({"_id": current["_id"], "version": current.get("version")}, update)
+        swapped = bool(result.modified_count)
+    except PyMongoError:
+        # the update may have been applied before the error, then the row already holds our version number.
+        # only the unique (file_id, version) insert above could have got us that number
+        if not await files_metadata_collection.find_one({"_id": current["_id"], "version": version + 1}, {"_id": 1}):
+            await file_versions_collection.delete_one({"_id": inserted.inserted_id})
+            raise
+        swapped = True
+    if not swapped:
+        await file_versions_collection.delete_one({"_id": inserted.inserted_id})
+        raise HTTPException(status_code=409, detail="The file was changed while uploading. Please retry.")
+
+    # from here on the row holds the new content, so nothing below may fail the upload and release it
+    try:
+        await prune_versions(current["_id"])
+    except Exception as e:
+        print(f"Pruning old versions of file {current['_id']} failed, the next upload prunes them: {e}")
+    return version + 1
+
+
+async def prune_versions(file_id):
+    # keeps the newest FILE_MAX_VERSIONS versions, the older ones release their content
+    if FILE_MAX_VERSIONS <= 0:
+        return
+    old_versions = await file_versions_collection.find(
+        {"file_id": file_id}, {"gridfs_id": 1, "sha256": 1}
+    ).sort("version", DESCENDING).skip(FILE_MAX_VERSIONS).to_list(length=None)
+    if old_versions:
+        await release_blobs(await claim_rows(file_versions_collection, old_versions))
+
+
+async def purge_versions(file_ids: list):
+    # every stored version of files that are purged for good
+    versions = await file_versions_collection.find({"file_id": {"$in": file_ids}}, {"gridfs_id": 1, "sha256": 1}).to_list(length=None)
+    purged = await claim_rows(file_versions_collection, versions)
+    await release_blobs(purged)
+    return len(purged)
@@ -0,0 +1,96 @@
+import asyncio
+import time
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from configuration.settings import AUTH_POOL_WORKERS, AUTH_POOL_MAX_QUEUE, MEDIA_POOL_WORKERS, MEDIA_POOL_MAX_QUEUE
+from utility.faces import encode_face, face_libraries
+from utility.metrics import stage
+
+
+class BoundedWorkerPool:
+    # runs cpu bound calls off the event loop and rejects new work once too much is already waiting
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.in_flight = 0   # running + waiting calls
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_run_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, func, *args):
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        def timed_call():
+            started = time.perf_counter()
+            return started, func(*args)
+
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(self._executor, timed_call)
+        finally:
+            self.in_flight -= 1
+
+        finished = time.perf_counter()
+        self.completed += 1
+        self.total_wait_seconds += started - submitted
+        self.total_run_seconds += finished - started
+        self.max_wait_seconds = max(self.max_wait_seconds, started - submitted)
+        self.max_run_seconds = max(self.max_run_seconds, finished - started)
+        return result
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": self.total_wait_seconds / self.completed * 1000 if self.completed else 0.0,
+            "avg_run_ms": self.total_run_seconds / self.completed * 1000 if self.completed else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "max_run_ms": self.max_run_seconds * 1000,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# bcrypt and face encoding release the GIL for most of their work, so threads are enough here
+auth_pool = BoundedWorkerPool("auth", AUTH_POOL_WORKERS, AUTH_POOL_MAX_QUEUE)
+# image work for uploads (thumbnails) gets its own pool so it can never delay logins
+media_pool = BoundedWorkerPool("media", MEDIA_POOL_WORKERS, MEDIA_POOL_MAX_QUEUE)
+
+
+async def hash_password(password: str):
+    with stage("bcrypt"):
+        return await auth_pool.run(lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()))
+
+
+async def check_password(password: str, hashed_password: bytes):
+    with stage("bcrypt"):
+        return await auth_pool.run(bcrypt.checkpw, password.encode("utf-8"), hashed_password)
+
+
+async def preload_face_libraries():
+    # optional warm up at startup, so the first login does not pay for loading dlib
+    await auth_pool.run(face_libraries)
+
+
+async def encode_face_async(image_bytes: bytes):
+    with stage("face_encoding"):
+        return await auth_pool.run(encode_face, image_bytes)